@@ -0,0 +1,147 @@
+import io
+import wave
+import struct
+
+# Format audio yang bisa diminta klien. "wav" adalah keluaran asli Coqui,
+# format lain dienkode di memori dari file WAV tersebut.
+AUDIO_FORMATS = {
+    "wav": {"media_type": "audio/wav", "ext": ".wav"},
+    "pcm16k": {"media_type": "audio/wav", "ext": ".wav", "frame_rate": 16000, "export": {"format": "wav"}},
+    "opus": {"media_type": "audio/ogg", "ext": ".ogg",
+             "export": {"format": "ogg", "codec": "libopus", "bitrate": "24k"}},
+    "mp3": {"media_type": "audio/mpeg", "ext": ".mp3",
+            "export": {"format": "mp3", "bitrate": "48k"}},
+}
+
+DEFAULT_FORMAT = "wav"
+
+# Pemetaan MIME type di header Accept ke nama format
+_ACCEPT_TYPES = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/webm": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/l16": "pcm16k",
+}
+
+def negotiate_format(accept: str = None, requested: str = None) -> str:
+    """
+    Tentukan format audio respons.
+    Args:
+        accept (str): Nilai header Accept dari klien
+        requested (str): Format eksplisit dari query parameter, diprioritaskan
+    Returns:
+        str: Nama format di AUDIO_FORMATS
+    """
+    if requested:
+        requested = requested.lower()
+        if requested in AUDIO_FORMATS:
+            return requested
+
+    if accept:
+        candidates = []
+        for i, part in enumerate(accept.split(",")):
+            fields = [f.strip() for f in part.split(";")]
+            media_type = fields[0].lower()
+            quality = 1.0
+            for field in fields[1:]:
+                if field.startswith("q="):
+                    try:
+                        quality = float(field[2:])
+                    except ValueError:
+                        quality = 0.0
+            if media_type in _ACCEPT_TYPES and quality > 0:
+                # Urutkan berdasarkan q, lalu urutan kemunculan di header
+                candidates.append((-quality, i, _ACCEPT_TYPES[media_type]))
+        if candidates:
+            return min(candidates)[2]
+
+    return DEFAULT_FORMAT
+
+def encode_audio(wav, fmt: str) -> bytes:
+    """
+    Enkode audio WAV ke format lain di memori.
+    Args:
+        wav (bytes | str): Isi file WAV atau path file WAV sumber
+        fmt (str): Nama format di AUDIO_FORMATS
+    Returns:
+        bytes: Audio terenkode
+    """
+    spec = AUDIO_FORMATS[fmt]
+    if "export" not in spec:
+        if isinstance(wav, (bytes, bytearray)):
+            return bytes(wav)
+        with open(wav, "rb") as f:
+            return f.read()
+
+    from pydub import AudioSegment
+
+    segment = AudioSegment.from_wav(io.BytesIO(wav) if isinstance(wav, (bytes, bytearray)) else wav)
+    if "frame_rate" in spec:
+        segment = segment.set_frame_rate(spec["frame_rate"]).set_channels(1).set_sample_width(2)
+
+    buf = io.BytesIO()
+    segment.export(buf, **spec["export"])
+    return buf.getvalue()
+
+def pcm16_to_wav_bytes(pcm: bytes, sample_rate: int = 16000, channels: int = 1) -> bytes:
+    """Bungkus PCM 16-bit mentah menjadi file WAV di memori."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+def wav_duration_seconds(source):
+    """
+    Durasi audio WAV dari header-nya.
+    Args:
+        source (bytes | str): Isi file WAV atau path ke file WAV
+    Returns:
+        float | None: Durasi dalam detik, atau None jika bukan WAV yang valid
+    """
+    try:
+        with wave.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source, "rb") as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except (wave.Error, EOFError, ZeroDivisionError, OSError):
+        return None
+
+def parse_wav_header(header: bytes):
+    """
+    Baca informasi format dari awal file WAV (RIFF) tanpa membutuhkan isi file lengkap,
+    sehingga klip yang terlalu panjang bisa ditolak sebelum seluruh upload diterima.
+    Args:
+        header (bytes): Beberapa KB pertama file
+    Returns:
+        dict | None: {"sample_rate", "channels", "byte_rate", "data_size", "duration"},
+            None jika header belum lengkap atau bukan WAV. data_size/duration bernilai
+            None jika ukuran chunk data tidak diketahui (WAV streaming).
+    """
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+
+    info = {}
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id, chunk_size = struct.unpack("<4sI", header[offset:offset + 8])
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            if body + 16 > len(header):
+                return None
+            _, channels, sample_rate, byte_rate = struct.unpack("<HHII", header[body:body + 12])
+            info.update(sample_rate=sample_rate, channels=channels, byte_rate=byte_rate)
+        elif chunk_id == b"data":
+            if "byte_rate" not in info:
+                return None
+            # 0 / 0xFFFFFFFF dipakai encoder streaming ketika panjang belum diketahui
+            unknown = chunk_size in (0, 0xFFFFFFFF)
+            info["data_size"] = None if unknown else chunk_size
+            info["duration"] = None if unknown or not info["byte_rate"] else chunk_size / info["byte_rate"]
+            return info
+        offset = body + chunk_size + (chunk_size & 1)
+    return None
@@ -0,0 +1,117 @@
+import os
+import threading
+import subprocess
+from contextlib import contextmanager
+
+from app import metrics
+
+# Jumlah core yang boleh dipakai proses ini (menghormati taskset/cgroup jika tersedia)
+try:
+    _AVAILABLE_CORES = sorted(os.sched_getaffinity(0))
+except AttributeError:
+    _AVAILABLE_CORES = list(range(os.cpu_count() or 1))
+
+CPU_CORES = int(os.getenv("CPU_CORES", str(len(_AVAILABLE_CORES))))
+
+# Batas thread per job. Whisper dan torch jarang lebih cepat di atas ~8 thread per proses.
+CPU_MIN_THREADS_PER_JOB = int(os.getenv("CPU_MIN_THREADS_PER_JOB", "1"))
+CPU_MAX_THREADS_PER_JOB = int(os.getenv("CPU_MAX_THREADS_PER_JOB", "8"))
+
+# Set CPU_AFFINITY=1 untuk mengikat setiap proses whisper/Coqui ke core-nya sendiri
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "0") == "1"
+
+# Variabel lingkungan yang membatasi thread pool native (torch intra-op, OpenMP, BLAS)
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+class Budget:
+    """Jatah CPU untuk satu job: jumlah thread dan (opsional) daftar core."""
+
+    def __init__(self, threads: int, cores: list = None):
+        self.threads = threads
+        self.cores = cores or []
+
+    def env(self, base: dict = None) -> dict:
+        """Lingkungan subprocess dengan thread pool native dibatasi ke jatah ini."""
+        env = dict(os.environ if base is None else base)
+        for name in _THREAD_ENV_VARS:
+            env[name] = str(self.threads)
+        return env
+
+class CoreScheduler:
+    """
+    Bagi core CPU antar job STT/TTS yang berjalan bersamaan agar whisper-cli dan
+    Coqui (torch) tidak saling berebut core. Setiap job mendapat bagian rata dari
+    CPU_CORES berdasarkan jumlah job yang sedang berjalan saat job itu dimulai;
+    job yang sudah berjalan tetap memakai jatahnya sampai selesai.
+    """
+
+    def __init__(self, cores: int = CPU_CORES, min_threads: int = CPU_MIN_THREADS_PER_JOB,
+                 max_threads: int = CPU_MAX_THREADS_PER_JOB, affinity: bool = CPU_AFFINITY):
+        self.cores = max(1, cores)
+        self.min_threads = max(1, min_threads)
+        self.max_threads = max(self.min_threads, max_threads)
+        self.affinity = affinity
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._core_usage = {core: 0 for core in _AVAILABLE_CORES[:self.cores]}
+
+    def _allocate(self, kind: str) -> Budget:
+        with self._lock:
+            self._inflight[kind] = self._inflight.get(kind, 0) + 1
+            running = sum(self._inflight.values())
+            threads = max(self.min_threads, min(self.max_threads, self.cores // running))
+
+            cores = []
+            if self.affinity and self._core_usage:
+                # Core yang paling sedikit dipakai lebih dulu
+                cores = sorted(self._core_usage, key=lambda c: (self._core_usage[c], c))[:threads]
+                for core in cores:
+                    self._core_usage[core] += 1
+            return Budget(threads, cores)
+
+    def _release(self, kind: str, budget: Budget):
+        with self._lock:
+            self._inflight[kind] -= 1
+            for core in budget.cores:
+                self._core_usage[core] -= 1
+
+    @contextmanager
+    def job(self, kind: str):
+        """
+        Daftarkan satu job selama blok berjalan.
+        Args:
+            kind (str): Jenis job, misalnya "stt" atau "tts"
+        Yields:
+            Budget: Jatah thread (dan core jika CPU_AFFINITY=1) untuk job ini
+        """
+        budget = self._allocate(kind)
+        metrics.observe("cpu_threads_budget", budget.threads, {"kind": kind})
+        try:
+            yield budget
+        finally:
+            self._release(kind, budget)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"cores": self.cores, "inflight": dict(self._inflight)}
+
+scheduler = CoreScheduler()
+
+def run(cmd: list, budget: Budget, **kwargs) -> subprocess.CompletedProcess:
+    """
+    Seperti subprocess.run(cmd, check=True, capture_output=True, text=True), tetapi
+    thread pool native proses anak dibatasi sesuai `budget` dan, jika ada core yang
+    dialokasikan, proses diikat ke core tersebut.
+    """
+    kwargs["env"] = budget.env(kwargs.get("env"))
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **kwargs) as proc:
+        if budget.cores:
+            try:
+                # Thread yang dibuat proses anak setelah ini mewarisi affinity-nya
+                os.sched_setaffinity(proc.pid, budget.cores)
+            except (AttributeError, OSError):
+                pass
+        stdout, stderr = proc.communicate()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
@@ -0,0 +1,92 @@
+import os
+import json
+import asyncio
+import hashlib
+
+from app.state import get_backend
+
+# Lama hasil giliran voice chat disimpan agar retry klien langsung mendapat hasil yang sama
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "120"))
+
+# Batas waktu menunggu worker lain yang sedang memproses kunci yang sama
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "600"))
+
+_inflight = {}  # kunci -> asyncio.Task yang sedang berjalan di proses ini
+
+def derive_key(base: str, session_id: str) -> str:
+    """
+    Kunci idempotensi yang selalu terikat ke sesi, sehingga kunci yang sama dari
+    sesi lain tidak pernah mendapat hasil giliran sesi ini.
+    Args:
+        base (str): Kunci dari klien, atau hash audio jika klien tidak mengirimnya
+        session_id (str): ID sesi percakapan
+    """
+    return hashlib.sha256(f"{session_id}:{base}".encode("utf-8")).hexdigest()
+
+def _result_key(key: str) -> str:
+    return f"voice_turn:{key}"
+
+def load_result(key: str):
+    """
+    Ambil hasil giliran yang sudah selesai dari backend state.
+    Returns:
+        dict | None: {"transcription", "response", "audio", ...} dengan audio berupa
+            bytes WAV, atau None
+    """
+    backend = get_backend()
+    meta = backend.get(_result_key(key))
+    audio = backend.get(_result_key(key) + ":wav")
+    if meta is None or audio is None:
+        return None
+
+    result = json.loads(meta.decode("utf-8"))
+    result["audio"] = audio
+    return result
+
+def store_result(key: str, result: dict):
+    """Simpan hasil giliran (teks dan audio WAV) selama IDEMPOTENCY_TTL_SECONDS."""
+    backend = get_backend()
+    backend.set(_result_key(key) + ":wav", result["audio"], ttl=IDEMPOTENCY_TTL_SECONDS)
+    meta = {k: v for k, v in result.items() if k != "audio"}
+    backend.set(_result_key(key), json.dumps(meta), ttl=IDEMPOTENCY_TTL_SECONDS)
+
+async def _run_exclusive(key: str, fn):
+    cached = await asyncio.to_thread(load_result, key)
+    if cached is not None:
+        return cached, True
+
+    # Lock lintas worker: worker lain dengan kunci yang sama menunggu lalu memakai hasil ini
+    backend = get_backend()
+    lock_name = f"voice_turn_lock:{key}"
+    token = await backend.acquire_async(lock_name, IDEMPOTENCY_WAIT_SECONDS, IDEMPOTENCY_WAIT_SECONDS)
+    try:
+        cached = await asyncio.to_thread(load_result, key)
+        if cached is not None:
+            return cached, True
+
+        result = await fn()
+        await asyncio.to_thread(store_result, key, result)
+        return result, False
+    finally:
+        await asyncio.to_thread(backend.release, lock_name, token)
+
+async def run_once(key: str, fn):
+    """
+    Jalankan `fn` (coroutine function tanpa argumen) paling banyak sekali per kunci.
+    Hasil `fn` harus berupa data saja (audio sebagai bytes, bukan path file) karena
+    dibagi ke semua permintaan yang menunggu kunci yang sama.
+    Permintaan identik yang datang bersamaan menunggu task yang sama (single-flight),
+    dan permintaan ulang dalam IDEMPOTENCY_TTL_SECONDS mendapat hasil tersimpan.
+    Returns:
+        tuple: (hasil, True jika hasil dipakai ulang dari permintaan lain)
+    """
+    task = _inflight.get(key)
+    if task is not None:
+        result, _ = await asyncio.shield(task)
+        return result, True
+
+    task = asyncio.create_task(_run_exclusive(key, fn))
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: klien yang memutus koneksi tidak membatalkan pipeline yang ditunggu klien lain
+    return await asyncio.shield(task)
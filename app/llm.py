@@ -1,28 +1,51 @@
 import os
-from google import genai
-from google.genai import types
-from pydantic import TypeAdapter
-from dotenv import load_dotenv
+import re
+import time
+import hashlib
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-# Path untuk file .env
-ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-ENV_PATH = os.path.join(ROOT_DIR, '.env')
+from app import metrics
+from app.state import get_backend
 
-# Coba load menggunakan dotenv
-print(f"Loading .env from: {ENV_PATH}")
-load_dotenv(dotenv_path=ENV_PATH)
+logger = logging.getLogger(__name__)
 
 MODEL = "gemini-2.0-flash"
 
-# Coba dapatkan API key dari variabel lingkungan
-GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
-
-if not GOOGLE_API_KEY:
-    raise ValueError("GEMINI_API_KEY tidak ditemukan di file .env. Pastikan file .env berisi GEMINI_API_KEY=your_api_key")
-
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CHAT_HISTORY_FILE = os.path.join(BASE_DIR, "chat_history.json")
 
+# Sesi yang dipakai jika klien tidak mengirim session_id. Riwayat lama di
+# chat_history.json diimpor ke sesi ini saat pertama kali dimuat.
+DEFAULT_SESSION = "default"
+
+# === Mode SLO latensi (opsional) ===
+# Nonaktif secara default (LLM_DEADLINE_SECONDS=0): Gemini ditunggu sampai menjawab.
+# Jika diaktifkan dan Gemini belum menjawab dalam LLM_DEADLINE_SECONDS, kirim permintaan
+# kedua (hedge) dan tunggu paling lama LLM_HEDGE_DEADLINE_SECONDS lagi; mana yang selesai
+# duluan dipakai. Jika keduanya tetap terlambat, jawab dari fallback: cache respons,
+# model lokal (lihat set_local_fallback), lalu LLM_FALLBACK_REPLY.
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "0"))
+LLM_HEDGE_DEADLINE_SECONDS = float(os.getenv("LLM_HEDGE_DEADLINE_SECONDS", "4.0"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") != "0"
+
+# Timeout HTTP klien Gemini. Dalam mode SLO default-nya total kedua deadline, sehingga
+# panggilan yang sudah kalah tidak menahan thread _llm_executor selamanya. 0 = tanpa timeout.
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv(
+    "LLM_REQUEST_TIMEOUT_SECONDS",
+    str(LLM_DEADLINE_SECONDS + LLM_HEDGE_DEADLINE_SECONDS if LLM_DEADLINE_SECONDS > 0 else 0),
+))
+
+# Jawaban terakhir untuk prompt yang sama dalam sesi yang sama disimpan di backend
+# state sebagai fallback
+LLM_RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "86400"))
+
+# Balasan kalengan jika tidak ada fallback lain. Default-nya sama dengan salah satu
+# FILLER_TEXTS di app/tts.py sehingga audionya langsung tersedia.
+LLM_FALLBACK_REPLY = os.getenv("LLM_FALLBACK_REPLY", "Tunggu sebentar.")
+
 # Prompt sistem yang digunakan untuk membimbing gaya respons LLM
 system_instruction = """
 You are a responsive, intelligent, and fluent virtual assistant who communicates in Indonesian.
@@ -43,52 +66,238 @@ Assistant: Presiden Indonesia saat ini adalah Joko Widodo.
 If you're unsure about an answer, be honest and say that you don't know.
 """
 
-# TODO: Inisialisasi klien Gemini dan konfigurasi prompt
-# Gunakan genai.Client(api_key=...) untuk membuat klien.
-# Gunakan types.GenerateContentConfig(system_instruction=...) untuk membuat konfigurasi awal.
-# Jika ingin melihat contoh implementasi, baca dokumentasi resmi Gemini:
-# https://github.com/google-gemini/cookbook/blob/main/quickstarts/Get_started.ipynb
-client = genai.Client(api_key=GOOGLE_API_KEY)
-chat_config = types.GenerateContentConfig(system_instruction=system_instruction)
-history_adapter = TypeAdapter(list[types.Content])
+# Klien Gemini, konfigurasi, dan sesi chat dibuat secara lazy (saat pertama kali
+# dibutuhkan atau dari lifespan FastAPI), bukan saat modul di-import. Dengan begitu
+# import app.main tetap cepat dan tidak gagal walaupun GEMINI_API_KEY belum tersedia.
+_client = None
+_chat_config = None
+_history_adapter = None
+_chats = {}  # session_id -> (json riwayat terakhir, objek chat) per proses
+_llm_lock = threading.RLock()
+
+# Panggilan Gemini dijalankan di thread terpisah agar bisa dibatasi dengan deadline.
+# Panggilan yang kalah tetap berjalan sampai selesai dan hasilnya dibuang.
+_llm_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_WORKERS", "8")), thread_name_prefix="llm")
+
+# Fungsi (prompt) -> str untuk model lokal CPU-only, dipakai sebagai fallback
+_local_fallback = None
+
+def _load_api_key() -> str:
+    # .env sudah dimuat oleh app/main.py saat startup
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY tidak ditemukan di file .env. Pastikan file .env berisi GEMINI_API_KEY=your_api_key")
+    return api_key
+
+def get_client():
+    """Kembalikan klien Gemini, dibuat pada pemanggilan pertama."""
+    global _client
+    if _client is None:
+        with _llm_lock:
+            if _client is None:
+                from google import genai
+                from google.genai import types
+                http_options = None
+                if LLM_REQUEST_TIMEOUT_SECONDS > 0:
+                    # HttpOptions.timeout dalam milidetik
+                    http_options = types.HttpOptions(timeout=int(LLM_REQUEST_TIMEOUT_SECONDS * 1000))
+                _client = genai.Client(api_key=_load_api_key(), http_options=http_options)
+    return _client
+
+def get_chat_config():
+    global _chat_config
+    if _chat_config is None:
+        from google.genai import types
+        _chat_config = types.GenerateContentConfig(system_instruction=system_instruction)
+    return _chat_config
+
+def get_history_adapter():
+    global _history_adapter
+    if _history_adapter is None:
+        from google.genai import types
+        from pydantic import TypeAdapter
+        _history_adapter = TypeAdapter(list[types.Content])
+    return _history_adapter
 
 # Fungsi untuk menyimpan/memuat riwayat chat
 def export_chat_history(chat) -> str:
-    return history_adapter.dump_json(chat.get_history()).decode("utf-8")
+    return get_history_adapter().dump_json(chat.get_history()).decode("utf-8")
+
+def _history_key(session_id: str) -> str:
+    return f"chat_history:{session_id}"
 
-def save_chat_history(chat):
+def save_chat_history(chat, session_id: str = DEFAULT_SESSION):
     json_history = export_chat_history(chat)
-    with open(CHAT_HISTORY_FILE, "w", encoding="utf-8") as f:
-        f.write(json_history)
+    get_backend().set(_history_key(session_id), json_history)
+    _chats[session_id] = (json_history, chat)
 
-def load_chat_history():
-    if not os.path.exists(CHAT_HISTORY_FILE):
-        return client.chats.create(model=MODEL, config=chat_config)
-    
-    if os.path.getsize(CHAT_HISTORY_FILE) == 0:
-        return client.chats.create(model=MODEL, config=chat_config)
+def _read_history_json(session_id: str) -> str:
+    """Baca riwayat dari backend state; sesi default jatuh ke chat_history.json lama."""
+    raw = get_backend().get(_history_key(session_id))
+    if raw is not None:
+        return raw.decode("utf-8").strip()
 
+    if session_id != DEFAULT_SESSION or not os.path.exists(CHAT_HISTORY_FILE):
+        return ""
     with open(CHAT_HISTORY_FILE, "r", encoding="utf-8") as f:
-        json_str = f.read().strip()
+        return f.read().strip()
+
+def load_chat_history(session_id: str = DEFAULT_SESSION):
+    json_str = _read_history_json(session_id)
+
+    # Riwayat tidak berubah sejak terakhir dimuat proses ini: pakai ulang objek chat
+    cached = _chats.get(session_id)
+    if cached is not None and cached[0] == json_str:
+        return cached[1]
 
     if not json_str:
-        return client.chats.create(model=MODEL, config=chat_config)
+        chat = get_client().chats.create(model=MODEL, config=get_chat_config())
+    else:
+        try:
+            history = get_history_adapter().validate_json(json_str)
+            chat = get_client().chats.create(model=MODEL, config=get_chat_config(), history=history)
+        except Exception as e:
+            logger.error("Gagal load history chat: %s", e)
+            chat = get_client().chats.create(model=MODEL, config=get_chat_config())
 
+    _chats[session_id] = (json_str, chat)
+    return chat
+
+def get_chat(session_id: str = DEFAULT_SESSION):
+    """Kembalikan sesi chat terbaru dari backend state bersama."""
+    return load_chat_history(session_id)
+
+def init_llm():
+    """Inisialisasi klien dan sesi chat default. Dipanggil dari lifespan FastAPI."""
+    get_chat()
+
+def set_local_fallback(fn):
+    """
+    Daftarkan model lokal sebagai fallback saat Gemini melewati deadline.
+    Args:
+        fn (callable): Fungsi (prompt: str) -> str; None untuk menonaktifkan
+    """
+    global _local_fallback
+    _local_fallback = fn
+
+def _response_cache_key(prompt: str, session_id: str) -> str:
+    # Terikat ke sesi: jawaban bisa bergantung pada riwayat percakapan sesi itu
+    normalized = " ".join(re.sub(r"[^\w\s]", " ", prompt.lower()).split())
+    digest = hashlib.sha1(f"{session_id}:{normalized}".encode("utf-8")).hexdigest()
+    return "llm_response:" + digest
+
+def _fallback_response(prompt: str, session_id: str):
+    """
+    Jawaban cadangan tanpa Gemini.
+    Returns:
+        tuple: (teks, sumber) dengan sumber "cache", "local", atau "canned"
+    """
     try:
-        history = history_adapter.validate_json(json_str)
-        return client.chats.create(model=MODEL, config=chat_config, history=history)
+        cached = get_backend().get(_response_cache_key(prompt, session_id))
+        if cached is not None:
+            return cached.decode("utf-8"), "cache"
     except Exception as e:
-        print(f"[ERROR] Gagal load history chat: {e}")
-        return client.chats.create(model=MODEL, config=chat_config)
+        logger.warning("Gagal membaca cache respons LLM: %s", e)
+
+    if _local_fallback is not None:
+        try:
+            text = _local_fallback(prompt)
+            if text:
+                return text.strip(), "local"
+        except Exception as e:
+            logger.warning("Model lokal gagal: %s", e)
+
+    return LLM_FALLBACK_REPLY, "canned"
+
+def _send_hedge(history: list, prompt: str):
+    """Permintaan kedua tanpa state: riwayat dikirim eksplisit, objek chat tidak diubah."""
+    from google.genai import types
+    user_content = types.Content(role="user", parts=[types.Part(text=prompt)])
+    response = get_client().models.generate_content(
+        model=MODEL, contents=history + [user_content], config=get_chat_config()
+    )
+    return response, history + [user_content, response.candidates[0].content]
 
-# Inisialisasi sesi chat saat aplikasi dimulai
-chat = load_chat_history()
+def _save_history_list(history: list, session_id: str):
+    json_history = get_history_adapter().dump_json(history).decode("utf-8")
+    get_backend().set(_history_key(session_id), json_history)
+    # Objek chat lama tidak mengikuti riwayat ini; buat ulang saat dibutuhkan
+    _chats.pop(session_id, None)
+
+def _submit(fn, *args):
+    return _llm_executor.submit(contextvars.copy_context().run, fn, *args)
+
+def _generate_with_deadline(prompt: str, session_id: str):
+    """
+    Kirim prompt dengan deadline, hedge, dan fallback.
+    Returns:
+        tuple: (teks respons, sumber) dengan sumber "primary", "hedge", "cache", "local", atau "canned"
+    """
+    chat = get_chat(session_id)
+    # Salinan riwayat terkurasi (yang dikirim send_message) diambil sebelum primary
+    # berjalan; get_history() mengembalikan list yang akan diubah oleh primary
+    history = list(chat.get_history(curated=True))
+    primary = _submit(chat.send_message, prompt)
+    pending = {primary}
+
+    done, pending = wait(pending, timeout=LLM_DEADLINE_SECONDS)
+    if not done and LLM_HEDGE:
+        metrics.increment("llm_hedge_total")
+        logger.info("LLM melewati deadline, mengirim hedge", extra={"deadline": LLM_DEADLINE_SECONDS})
+        pending.add(_submit(_send_hedge, history, prompt))
+        done, pending = wait(pending, timeout=LLM_HEDGE_DEADLINE_SECONDS, return_when=FIRST_COMPLETED)
+    elif not done:
+        done, pending = wait(pending, timeout=LLM_HEDGE_DEADLINE_SECONDS)
+
+    # Pemenang pertama yang sukses dipakai; kegagalan menunggu sisa permintaan
+    while done:
+        future = done.pop()
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning("Permintaan LLM gagal: %s", e)
+            if not done and pending:
+                done, pending = wait(pending, timeout=LLM_HEDGE_DEADLINE_SECONDS, return_when=FIRST_COMPLETED)
+            continue
+
+        if future is primary:
+            save_chat_history(chat, session_id)
+            return result.text.strip(), "primary"
+        response, new_history = result
+        _save_history_list(new_history, session_id)
+        return response.text.strip(), "hedge"
+
+    if pending:
+        # Permintaan yang masih berjalan akan mengubah objek chat ini; jangan dipakai ulang
+        _chats.pop(session_id, None)
+    elif primary.exception() is not None:
+        raise primary.exception()
+
+    text, source = _fallback_response(prompt, session_id)
+    metrics.increment("llm_fallback_total", {"source": source})
+    logger.warning("LLM tidak menjawab tepat waktu, memakai fallback", extra={"source": source})
+    return text, source
 
 # Kirim prompt ke LLM dan kembalikan respons teks
-def generate_response(prompt: str) -> str:
+def generate_response(prompt: str, session_id: str = DEFAULT_SESSION) -> str:
+    start = time.perf_counter()
+    metrics.increment("llm_requests_total")
     try:
-        response = chat.send_message(prompt)
-        save_chat_history(chat)
-        return response.text.strip()
+        # Lock per sesi menjaga urutan giliran percakapan walaupun permintaan
+        # untuk sesi yang sama ditangani worker yang berbeda
+        with get_backend().lock(f"chat_lock:{session_id}"):
+            if LLM_DEADLINE_SECONDS > 0:
+                text, source = _generate_with_deadline(prompt, session_id)
+            else:
+                chat = get_chat(session_id)
+                text = chat.send_message(prompt).text.strip()
+                save_chat_history(chat, session_id)
+                source = "primary"
+
+        if source in ("primary", "hedge"):
+            get_backend().set(_response_cache_key(prompt, session_id), text, ttl=LLM_RESPONSE_CACHE_TTL_SECONDS)
+        metrics.increment("llm_answer_total", {"source": source})
+        metrics.observe("llm_latency_seconds", time.perf_counter() - start, {"source": source})
+        return text
     except Exception as e:
-        return f"[ERROR] {str(e)}"
\ No newline at end of file
+        return f"[ERROR] {str(e)}"
@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import copy
+import queue
+import random
+import atexit
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Proporsi record INFO/DEBUG yang benar-benar ditulis (1.0 = semua). WARNING ke atas
+# selalu ditulis. Berguna untuk menekan volume log pada QPS tinggi.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+
+# Panjang maksimum pesan dan field tambahan (transkrip, respons LLM, stdout proses, ...)
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "300"))
+
+# Set LOG_JSON=0 untuk format teks biasa saat pengembangan lokal
+LOG_JSON = os.getenv("LOG_JSON", "1") != "0"
+
+# ID korelasi permintaan yang sedang diproses. asyncio.to_thread dan task asyncio
+# menyalin context secara otomatis sehingga ID ini ikut ke tahap STT, LLM, dan TTS.
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+# Atribut bawaan LogRecord; selain ini dianggap field tambahan dari `extra`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+def truncate(value, limit: int = LOG_MAX_FIELD_CHARS):
+    """Potong string panjang agar ukuran record log tetap kecil."""
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}...(+{len(value) - limit} chars)"
+    return value
+
+class RequestContextFilter(logging.Filter):
+    """Tempelkan ID korelasi ke record dan lakukan sampling; berjalan di thread pemanggil."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        if record.levelno < logging.WARNING and LOG_SAMPLE_RATE < 1.0:
+            return random.random() < LOG_SAMPLE_RATE
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Format record sebagai satu baris JSON dengan field terstruktur."""
+
+    def format(self, record):
+        data = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": truncate(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                data[key] = truncate(value)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler yang tidak memformat pesan di thread pemanggil. Interpolasi
+    argumen (%s) dan serialisasi JSON dilakukan oleh thread QueueListener.
+    """
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+_listener = None
+
+def setup_logging():
+    """
+    Pasang logging non-blocking: handler root hanya memasukkan record ke antrean,
+    dan satu thread QueueListener yang menulis ke stderr.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if LOG_JSON:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+        ))
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,46 +1,232 @@
 import os
 import logging
 import tempfile
-import shutil
 import uuid
 import re
 import base64
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
-from fastapi.responses import FileResponse, JSONResponse
+import asyncio
+from contextlib import asynccontextmanager
+import hashlib
+import aiofiles
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from dotenv import load_dotenv
+
+# Muat .env sebelum modul aplikasi di-import: konfigurasi di app/*.py dibaca dari
+# environment saat import, sedangkan klien Gemini tetap dibuat secara lazy.
+ENV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+load_dotenv(dotenv_path=ENV_PATH)
 
 # Import fungsi dari modul lain
-from app.stt import transcribe_speech_to_text
-from app.llm import generate_response
-from app.tts import transcribe_text_to_speech
-
-# Konfigurasi logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from app import stt, tts, cpu, metrics, idempotency
+from app.stt import transcribe_speech_file_with_info
+from app.llm import generate_response, init_llm, DEFAULT_SESSION
+from app.tts import transcribe_text_to_speech, NOT_HEARD_TEXT
+from app.audio_codec import AUDIO_FORMATS, negotiate_format, parse_wav_header
+from app.streaming import StreamingSession, parse_config_message
+from app.vad import detect_silence
+from app.log import setup_logging, request_id_var
+
+# Konfigurasi logging: JSON terstruktur lewat antrean non-blocking (lihat app/log.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Status kesiapan komponen, diisi oleh task warm-up di lifespan
+readiness = {"llm": False, "stt": False, "tts": False}
+
+async def _warm_up_component(name, fn):
+    try:
+        readiness[name] = bool(await asyncio.to_thread(fn) is not False)
+    except Exception as e:
+        logger.error("Warm-up %s gagal: %s", name, e)
+        readiness[name] = False
+    logger.info("Warm-up %s selesai: %s", name, "siap" if readiness[name] else "gagal")
+
+async def _warm_up_models():
+    # LLM, STT, dan TTS tidak saling bergantung sehingga bisa dipanaskan bersamaan
+    await asyncio.gather(
+        _warm_up_component("llm", init_llm),
+        _warm_up_component("stt", stt.warm_up),
+        _warm_up_component("tts", tts.warm_up),
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up dijalankan di background agar server langsung menerima koneksi;
+    # gunakan /ready untuk mengetahui kapan model sudah siap.
+    warmup_task = asyncio.create_task(_warm_up_models())
+    yield
+    warmup_task.cancel()
+
 # Buat instance FastAPI
-app = FastAPI(title="Voice Chatbot API")
+app = FastAPI(title="Voice Chatbot API", lifespan=lifespan)
+
+# Batas upload audio. Body request dihitung per chunk oleh UploadLimitMiddleware dan
+# ditolak (413) begitu melewati batas, termasuk upload chunked tanpa Content-Length.
+# Durasi WAV dicek dari header saat file disalin ke UPLOAD_DIR, sebelum model apa pun
+# dijalankan.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_AUDIO_SECONDS = float(os.getenv("MAX_AUDIO_SECONDS", "120"))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Header WAV (termasuk chunk LIST/metadata) diharapkan muncul di bagian awal file
+WAV_HEADER_PROBE_BYTES = 8 * 1024
+# Kelonggaran untuk boundary dan header multipart di luar isi file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "api_uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+class _UploadTooLarge(Exception):
+    pass
+
+class UploadLimitMiddleware:
+    """
+    Batasi ukuran body /voice-chat. Content-Length yang terlalu besar ditolak sebelum
+    body dibaca; selain itu byte yang diterima dihitung per chunk sehingga upload
+    tanpa Content-Length (chunked) dihentikan begitu melewati batas.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(
+            status_code=413,
+            content={"message": f"Ukuran upload melebihi batas {MAX_UPLOAD_BYTES} bytes"},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != "/voice-chat":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise _UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # Respons error yang dibuat aplikasi dari pembacaan body yang terputus diganti 413
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _UploadTooLarge:
+            pass
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded:
+            await self._reject(scope, receive, send)
+
+class RequestIdMiddleware:
+    """
+    Tetapkan ID korelasi per permintaan (dari header X-Request-ID atau UUID baru)
+    agar semua log STT, LLM, dan TTS untuk permintaan itu bisa ditelusuri bersama.
+    """
+
+    def __init__(self, app):
+        self.app = app
 
-# Tambahkan CORS middleware untuk mengizinkan request dari frontend
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+app.add_middleware(UploadLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)
+app.add_middleware(RequestIdMiddleware)
+
+# Tambahkan CORS middleware untuk mengizinkan request dari frontend.
+# Ditambahkan terakhir agar menjadi lapisan terluar dan respons 413 tetap membawa header CORS.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Mengizinkan semua origins
     allow_credentials=True,
     allow_methods=["*"],  # Mengizinkan semua methods
     allow_headers=["*"],  # Mengizinkan semua headers
-    expose_headers=["X-Transcription-Base64", "X-Response-Text-Base64", "Content-Disposition", "Content-Length"],  # Expose custom headers
+    expose_headers=["X-Transcription-Base64", "X-Response-Text-Base64", "X-Audio-Format", "X-Audio-Bytes-Saved", "X-Idempotent-Replay", "X-Request-ID", "X-STT-Segments", "X-STT-Parallelism", "Content-Disposition", "Content-Length"],  # Expose custom headers
 )
 
-# Folder untuk menyimpan file output
-OUTPUT_DIR = os.path.join(tempfile.gettempdir(), "api_outputs")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+async def save_upload(file: UploadFile, dest_path: str) -> tuple:
+    """
+    Salin file upload (yang sudah diterima dan di-spool oleh Starlette) ke disk per
+    chunk dengan batas ukuran dan durasi. Untuk WAV, header dibaca dari chunk pertama
+    sehingga klip yang terlalu panjang ditolak sebelum sisa file disalin.
+    Returns:
+        tuple: (jumlah byte yang ditulis, hash SHA-256 isi file)
+    Raises:
+        HTTPException: 413 jika melebihi batas, 400 jika header WAV tidak valid
+    """
+    is_wav = dest_path.lower().endswith(".wav")
+    header = b""
+    wav_info = None
+    total = 0
+    digest = hashlib.sha256()
+
+    async with aiofiles.open(dest_path, "wb") as out:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Ukuran upload melebihi batas {MAX_UPLOAD_BYTES} bytes")
+
+            if is_wav and wav_info is None:
+                header += chunk[:WAV_HEADER_PROBE_BYTES - len(header)]
+                wav_info = parse_wav_header(header)
+                if wav_info is None and len(header) >= WAV_HEADER_PROBE_BYTES:
+                    raise HTTPException(status_code=400, detail="Header WAV tidak valid")
+                if wav_info and wav_info["duration"] and wav_info["duration"] > MAX_AUDIO_SECONDS:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Durasi audio {wav_info['duration']:.1f} detik melebihi batas {MAX_AUDIO_SECONDS:.0f} detik",
+                    )
+
+            digest.update(chunk)
+            await out.write(chunk)
+
+    if is_wav and wav_info is None:
+        raise HTTPException(status_code=400, detail="Header WAV tidak valid")
+    # WAV streaming tanpa ukuran chunk data: perkirakan durasi dari ukuran file
+    if is_wav and wav_info["duration"] is None and wav_info["byte_rate"]:
+        if total / wav_info["byte_rate"] > MAX_AUDIO_SECONDS:
+            raise HTTPException(status_code=413, detail=f"Durasi audio melebihi batas {MAX_AUDIO_SECONDS:.0f} detik")
+    return total, digest.hexdigest()
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    logger.error(f"HTTP Exception: {exc.detail}")
+    logger.error("HTTP Exception: %s", exc.detail)
     return JSONResponse(
         status_code=exc.status_code,
         content={"message": str(exc.detail)},
@@ -48,7 +234,7 @@ async def http_exception_handler(request, exc):
 
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
-    logger.error(f"Unexpected error: {str(exc)}", exc_info=True)
+    logger.error("Unexpected error: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=500,
         content={"message": f"Terjadi kesalahan internal: {str(exc)}"},
@@ -60,6 +246,20 @@ async def root():
     logger.info("Root endpoint diakses")
     return {"message": "Voice Chatbot API sedang berjalan. Gunakan endpoint /voice-chat untuk berinteraksi."}
 
+@app.get("/ready")
+async def ready():
+    """Endpoint readiness: 200 hanya jika model STT dan TTS sudah warm."""
+    is_ready = readiness["stt"] and readiness["tts"]
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "components": readiness},
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrik proses ini (routing model STT, dll.) dalam format JSON."""
+    return {"stt_queue_depth": stt.queue_depth(), "cpu": cpu.scheduler.snapshot(), **metrics.snapshot()}
+
 # Fungsi untuk membersihkan teks header
 def clean_header_value(text):
     """Membersihkan nilai untuk digunakan dalam header HTTP"""
@@ -80,100 +280,161 @@ def encode_base64(text):
     except:
         return ""
 
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def _consume_file(path: str) -> bytes:
+    """Baca lalu hapus file audio milik pemanggil (hasil transcribe_text_to_speech)."""
+    try:
+        return _read_file(path)
+    finally:
+        os.remove(path)
+
+async def _not_heard_turn(stage: str) -> dict:
+    """Hasil giliran untuk rekaman tanpa ucapan, memakai audio NOT_HEARD_TEXT yang sudah disiapkan."""
+    metrics.increment("voice_not_heard_total", {"stage": stage})
+    audio_path = await asyncio.to_thread(transcribe_text_to_speech, NOT_HEARD_TEXT)
+    if audio_path.startswith("[ERROR]"):
+        logger.error("Konversi text-to-speech gagal: %s", audio_path)
+        raise HTTPException(status_code=500, detail=f"Konversi text-to-speech gagal: {audio_path}")
+    return {
+        "transcription": "",
+        "response": NOT_HEARD_TEXT,
+        "audio": await asyncio.to_thread(_consume_file, audio_path),
+        "stt_segments": 0,
+        "stt_parallelism": 1.0,
+    }
+
+async def run_voice_turn(upload_path: str, session_id: str) -> dict:
+    """
+    Jalankan pipeline STT -> LLM -> TTS untuk satu giliran voice chat.
+    Returns:
+        dict: {"transcription", "response", "audio", "stt_segments", "stt_parallelism"}
+            dengan audio berupa bytes WAV
+    Raises:
+        HTTPException: jika salah satu tahap gagal
+    """
+    # Langkah 0: Rekaman kosong/hening langsung dijawab tanpa STT, LLM, dan TTS
+    silence = await asyncio.to_thread(detect_silence, upload_path)
+    if silence is not None and silence["silent"]:
+        logger.info("Rekaman hening, pipeline dilewati", extra=silence)
+        return await _not_heard_turn("precheck")
+
+    # Langkah 1: Konversi suara ke teks menggunakan Whisper
+    logger.info("Memulai konversi speech-to-text")
+    # Rekaman panjang dipotong di titik hening dan ditranskrip paralel
+    transcription, stt_info = await asyncio.to_thread(transcribe_speech_file_with_info, upload_path)
+    
+    # Periksa apakah transkripsi berhasil
+    if transcription.startswith("[ERROR]"):
+        logger.error("Konversi speech-to-text gagal: %s", transcription)
+        raise HTTPException(status_code=500, detail=f"Konversi speech-to-text gagal: {transcription}")
+    
+    logger.info("Hasil transkripsi diterima", extra={"transcript": transcription})
+
+    # Semua segmen dibuang whisper sebagai derau/keheningan: jangan kirim ke LLM
+    if not transcription.strip():
+        return await _not_heard_turn("stt")
+    
+    # Langkah 2: Dapatkan respons menggunakan model Gemini
+    logger.info("Menghasilkan respons LLM")
+    # Manfaatkan waktu tunggu Gemini untuk memanaskan ulang TTS jika sudah lama idle
+    tts.speculative_warm_up()
+    llm_response = await asyncio.to_thread(generate_response, transcription, session_id)
+    
+    # Periksa apakah pembuatan respons berhasil
+    if llm_response.startswith("[ERROR]"):
+        logger.error("Pembuatan respons LLM gagal: %s", llm_response)
+        raise HTTPException(status_code=500, detail=f"Pembuatan respons LLM gagal: {llm_response}")
+    
+    logger.info("Respons LLM diterima", extra={"llm_response": llm_response})
+    
+    # Langkah 3: Konversi teks respons menjadi suara
+    logger.info("Mengkonversi teks ke suara")
+    audio_response_path = await asyncio.to_thread(transcribe_text_to_speech, llm_response)
+    
+    # Periksa apakah path respons audio valid
+    if isinstance(audio_response_path, str) and audio_response_path.startswith("[ERROR]"):
+        logger.error("Konversi text-to-speech gagal: %s", audio_response_path)
+        raise HTTPException(status_code=500, detail=f"Konversi text-to-speech gagal: {audio_response_path}")
+    
+    # Verifikasi file response
+    if not os.path.exists(audio_response_path):
+        logger.error("Audio response file not found: %s", audio_response_path)
+        raise HTTPException(status_code=500, detail="Audio response file not found")
+    
+    file_size = os.path.getsize(audio_response_path)
+    if file_size == 0:
+        logger.error("Audio response file is empty: %s", audio_response_path)
+        os.remove(audio_response_path)
+        raise HTTPException(status_code=500, detail="Audio response file is empty")
+    
+    logger.info("Respons audio diverifikasi", extra={"path": audio_response_path, "size": file_size})
+
+    return {
+        "transcription": transcription,
+        "response": llm_response,
+        "audio": await asyncio.to_thread(_consume_file, audio_response_path),
+        "stt_segments": stt_info["segments"],
+        "stt_parallelism": round(stt_info["parallelism"], 2),
+    }
+
 @app.post("/voice-chat")
-async def voice_chat(file: UploadFile = File(...), system_prompt: str = Form(None)):
+async def voice_chat(
+    request: Request,
+    file: UploadFile = File(...),
+    system_prompt: str = Form(None),
+    session_id: str = Form(None),
+    idempotency_key: str = Form(None),
+    audio_format: str = Query(None, alias="format"),
+):
     """
     Endpoint utama untuk interaksi voice chat.
     
     Args:
         file: File audio yang diupload dari pengguna
         system_prompt: Prompt sistem tambahan yang opsional
+        session_id: ID sesi percakapan; riwayat chat disimpan per sesi di backend state
+        idempotency_key: Kunci idempotensi (juga bisa lewat header Idempotency-Key),
+            selalu digabung dengan session_id. Jika kosong, dipakai hash audio.
+        audio_format: Format audio respons (wav, pcm16k, opus, mp3). Jika kosong,
+            format dipilih dari header Accept dengan default wav.
     
     Returns:
-        FileResponse: File audio dengan respons dari chatbot
+        Response: Audio respons dari chatbot
     """
-    logger.info(f"Menerima permintaan voice chat dengan file: {file.filename}")
+    logger.info("Menerima permintaan voice chat dengan file: %s", file.filename)
     if system_prompt:
-        logger.info(f"System prompt disediakan: {system_prompt[:50]}...")
+        logger.info("System prompt disediakan", extra={"system_prompt": system_prompt})
     
-    temp_files = []
+    upload_path = None
     try:
-        # Baca konten file audio
-        audio_content = await file.read()
-        
         # Dapatkan ekstensi file dari nama file, defaultnya .wav jika tidak ada ekstensi
-        file_ext = os.path.splitext(file.filename)[1]
+        file_ext = os.path.splitext(file.filename or "")[1]
         if not file_ext:
             file_ext = ".wav"  # Default extension jika tidak ada
-        logger.info(f"Ekstensi file: {file_ext}")
-        
-        # Langkah 1: Konversi suara ke teks menggunakan Whisper
-        logger.info("Memulai konversi speech-to-text")
-        transcription = transcribe_speech_to_text(audio_content, file_ext)
-        
-        # Periksa apakah transkripsi berhasil
-        if transcription.startswith("[ERROR]"):
-            logger.error(f"Konversi speech-to-text gagal: {transcription}")
-            raise HTTPException(status_code=500, detail=f"Konversi speech-to-text gagal: {transcription}")
-        
-        logger.info(f"Hasil transkripsi: {transcription}")
-        
-        # Langkah 2: Dapatkan respons menggunakan model Gemini
-        # Tambahkan system prompt jika disediakan
-        logger.info("Menghasilkan respons LLM")
-        if system_prompt:
-            # Catatan: ini memerlukan modifikasi pada fungsi generate_response untuk menerima system_prompt
-            # Untuk saat ini, gunakan default prompt
-            llm_response = generate_response(transcription)
-        else:
-            llm_response = generate_response(transcription)
-        
-        # Periksa apakah pembuatan respons berhasil
-        if llm_response.startswith("[ERROR]"):
-            logger.error(f"Pembuatan respons LLM gagal: {llm_response}")
-            raise HTTPException(status_code=500, detail=f"Pembuatan respons LLM gagal: {llm_response}")
-        
-        logger.info(f"Respons LLM: {llm_response}")
-        
-        # Langkah 3: Konversi teks respons menjadi suara
-        logger.info("Mengkonversi teks ke suara")
-        audio_response_path = transcribe_text_to_speech(llm_response)
-        
-        # Periksa apakah path respons audio valid
-        if isinstance(audio_response_path, str) and audio_response_path.startswith("[ERROR]"):
-            logger.error(f"Konversi text-to-speech gagal: {audio_response_path}")
-            raise HTTPException(status_code=500, detail=f"Konversi text-to-speech gagal: {audio_response_path}")
-        
-        # Verifikasi file response
-        if not os.path.exists(audio_response_path):
-            logger.error(f"Audio response file not found: {audio_response_path}")
-            raise HTTPException(status_code=500, detail="Audio response file not found")
-        
-        file_size = os.path.getsize(audio_response_path)
-        if file_size == 0:
-            logger.error(f"Audio response file is empty: {audio_response_path}")
-            raise HTTPException(status_code=500, detail="Audio response file is empty")
-        
-        logger.info(f"Respons audio diverifikasi - path: {audio_response_path}, size: {file_size} bytes")
-        
-        # Salin file ke lokasi permanen dalam OUTPUT_DIR dengan nama yang unik
-        # untuk memastikan file tidak terhapus oleh sistem pembersihan tmp
-        permanent_filename = f"response_{uuid.uuid4()}.wav"
-        permanent_path = os.path.join(OUTPUT_DIR, permanent_filename)
-        
-        # Salin file dengan shutil
-        shutil.copy2(audio_response_path, permanent_path)
-        temp_files.append(permanent_path) # Tambahkan ke daftar file temporary
-        
-        logger.info(f"File audio response disalin ke path permanen: {permanent_path}")
-        
-        # Periksa kembali file yang baru disalin
-        if not os.path.exists(permanent_path):
-            logger.error(f"Permanent audio file not found after copy: {permanent_path}")
-            raise HTTPException(status_code=500, detail="Failed to create permanent audio file")
+        logger.debug("Ekstensi file: %s", file_ext)
+
+        # Salin file audio ke UPLOAD_DIR per chunk sambil memeriksa ukuran dan durasi
+        upload_path = os.path.join(UPLOAD_DIR, f"upload_{uuid.uuid4()}{file_ext}")
+        upload_size, upload_digest = await save_upload(file, upload_path)
+        logger.info("Upload disimpan", extra={"path": upload_path, "size": upload_size})
         
-        perm_file_size = os.path.getsize(permanent_path)
-        logger.info(f"Permanent file verified - path: {permanent_path}, size: {perm_file_size} bytes")
+        # Retry dan klik ganda memakai satu eksekusi pipeline yang sama (lihat app/idempotency.py)
+        session_id = session_id or DEFAULT_SESSION
+        client_key = idempotency_key or request.headers.get("idempotency-key")
+        turn_key = idempotency.derive_key(client_key or upload_digest, session_id)
+        result, replayed = await idempotency.run_once(
+            turn_key,
+            lambda: run_voice_turn(upload_path, session_id),
+        )
+        if replayed:
+            logger.info("Permintaan voice chat dilayani dari hasil idempoten", extra={"idempotency_key": turn_key})
+        transcription = result["transcription"]
+        llm_response = result["response"]
+        # Audio dikirim langsung dari memori; hasil replay tidak membuat file baru
+        audio_wav = result["audio"]
         
         # Langkah 4: Kembalikan file audio dengan header yang tepat
         # Gunakan base64 encoding untuk menghindari masalah karakter invalid dalam header
@@ -183,27 +444,195 @@ async def voice_chat(file: UploadFile = File(...), system_prompt: str = Form(Non
         transcription_b64 = encode_base64(transcription)
         response_text_b64 = encode_base64(llm_response)
         
+        # Negosiasi format audio respons (query parameter > header Accept > wav)
+        fmt = negotiate_format(request.headers.get("accept"), audio_format)
+        spec = AUDIO_FORMATS[fmt]
+        response_filename = f"response{spec['ext']}"
+
         headers = {
-            "Content-Disposition": f"attachment; filename=response.wav",
-            "Content-Length": str(perm_file_size),
-            "Access-Control-Expose-Headers": "X-Transcription-Base64, X-Response-Text-Base64, Content-Disposition, Content-Length",
+            "Content-Disposition": f"attachment; filename={response_filename}",
+            "Access-Control-Expose-Headers": "X-Transcription-Base64, X-Response-Text-Base64, X-Audio-Format, X-Audio-Bytes-Saved, X-Idempotent-Replay, X-Request-ID, X-STT-Segments, X-STT-Parallelism, Content-Disposition, Content-Length",
             "X-Transcription-Base64": transcription_b64,
-            "X-Response-Text-Base64": response_text_b64
+            "X-Response-Text-Base64": response_text_b64,
+            "X-Audio-Format": fmt,
+            "X-Idempotent-Replay": "true" if replayed else "false",
+            # Jumlah segmen STT dan rata-rata segmen yang ditranskrip bersamaan
+            # (total waktu segmen / waktu tunggu), lihat transcribe_speech_file_with_info
+            "X-STT-Segments": str(result.get("stt_segments", 1)),
+            "X-STT-Parallelism": str(result.get("stt_parallelism", 1.0)),
         }
+
+        if fmt != "wav":
+            try:
+                encoded = await asyncio.to_thread(tts.get_encoded_audio, llm_response, audio_wav, fmt)
+            except Exception as e:
+                logger.error("Enkode audio ke %s gagal, mengembalikan WAV: %s", fmt, e)
+                encoded = None
+
+            if encoded:
+                bytes_saved = len(audio_wav) - len(encoded)
+                logger.info("Audio dienkode", extra={"format": fmt, "size": len(encoded), "bytes_saved": bytes_saved})
+                headers["X-Audio-Bytes-Saved"] = str(bytes_saved)
+                return Response(content=encoded, media_type=spec["media_type"], headers=headers)
+
+            headers["X-Audio-Format"] = "wav"
+            headers["Content-Disposition"] = "attachment; filename=response.wav"
+
+        headers["X-Audio-Bytes-Saved"] = "0"
+
+        return Response(content=audio_wav, media_type="audio/wav", headers=headers)
         
-        return FileResponse(
-            path=permanent_path,
-            media_type="audio/wav",
-            filename="response.wav",
-            headers=headers
-        )
-        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Terjadi kesalahan saat memproses permintaan voice chat: {str(e)}", exc_info=True)
+        logger.error("Terjadi kesalahan saat memproses permintaan voice chat: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Terjadi kesalahan: {str(e)}")
+    finally:
+        if upload_path and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+async def _stream_commit_windows(session: StreamingSession):
+    """Dekode dan commit jendela audio penuh di awal buffer, dipotong di titik hening."""
+    while session.needs_commit():
+        decode_bytes, commit_bytes = session.next_window()
+        chunk = session.snapshot(decode_bytes)
+        text = await asyncio.to_thread(stt.transcribe_pcm, chunk, session.sample_rate)
+        session.commit(commit_bytes, "" if text.startswith("[ERROR]") else text.strip())
+
+def _log_decode_error(task: asyncio.Task):
+    """Catat error dekode parsial di background tanpa menutup WebSocket."""
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Dekode parsial streaming gagal: %s", task.exception())
+
+async def _stream_decode(websocket: WebSocket, session: StreamingSession):
+    """Commit jendela audio yang penuh lalu kirim transkrip parsial dari ekor buffer."""
+    await _stream_commit_windows(session)
+
+    tail = session.snapshot()
+    text = await asyncio.to_thread(stt.transcribe_pcm_partial, tail, session.sample_rate) if tail else ""
+    if text.startswith("[ERROR]"):
+        return
+    await websocket.send_json({"type": "partial", "text": session.text_with(text.strip())})
+
+async def _stream_finalize(websocket: WebSocket, session: StreamingSession, fmt: str, session_id: str):
+    """Transkrip final, panggil LLM, dan kirim audio respons untuk satu ucapan."""
+    await _stream_commit_windows(session)
+
+    tail = session.snapshot()
+    tail_text = await asyncio.to_thread(stt.transcribe_pcm, tail, session.sample_rate) if tail else ""
+    if tail_text.startswith("[ERROR]"):
+        await websocket.send_json({"type": "error", "message": f"Konversi speech-to-text gagal: {tail_text}"})
+        return
+    transcription = session.text_with(tail_text.strip())
+    await websocket.send_json({"type": "final", "text": transcription})
+    if not transcription:
+        return
+
+    tts.speculative_warm_up()
+    llm_response = await asyncio.to_thread(generate_response, transcription, session_id)
+    if llm_response.startswith("[ERROR]"):
+        await websocket.send_json({"type": "error", "message": f"Pembuatan respons LLM gagal: {llm_response}"})
+        return
+    await websocket.send_json({"type": "response", "text": llm_response})
+
+    audio_path = await asyncio.to_thread(transcribe_text_to_speech, llm_response)
+    if audio_path.startswith("[ERROR]"):
+        await websocket.send_json({"type": "error", "message": f"Konversi text-to-speech gagal: {audio_path}"})
+        return
+
+    audio = None
+    try:
+        if fmt != "wav":
+            try:
+                audio = await asyncio.to_thread(tts.get_encoded_audio, llm_response, audio_path, fmt)
+            except Exception as e:
+                # Sama seperti endpoint HTTP: jika enkode gagal, kirim WAV
+                logger.error("Enkode audio ke %s gagal, mengirim WAV: %s", fmt, e)
+        if not audio:
+            fmt = "wav"
+            audio = await asyncio.to_thread(_read_file, audio_path)
+    finally:
+        os.remove(audio_path)
+    await websocket.send_json({"type": "audio", "format": fmt, "media_type": AUDIO_FORMATS[fmt]["media_type"], "size": len(audio)})
+    await websocket.send_bytes(audio)
+
+@app.websocket("/ws/voice-chat")
+async def voice_chat_stream(websocket: WebSocket):
+    """
+    Endpoint WebSocket full-duplex untuk voice chat streaming.
+
+    Protokol:
+        - Pesan teks pertama (opsional): JSON {"sample_rate": 16000, "format": "opus", "session_id": "..."};
+          sample_rate/format ditolak setelah frame audio pertama
+        - Pesan biner: frame PCM 16-bit mono little-endian selama pengguna berbicara
+        - Pesan teks {"event": "end"}: paksa akhir ucapan tanpa menunggu VAD
+    Server mengirim JSON {"type": "partial" | "final" | "response" | "audio" | "error", ...};
+    pesan "audio" selalu diikuti satu pesan biner berisi audio respons.
+    """
+    await websocket.accept()
+    session = StreamingSession()
+    fmt = negotiate_format(requested=websocket.query_params.get("format"))
+    session_id = websocket.query_params.get("session_id") or DEFAULT_SESSION
+    decode_task = None
+    audio_started = False
+    logger.info("Sesi WebSocket voice chat dimulai")
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            endpoint = False
+            if message.get("bytes"):
+                audio_started = True
+                endpoint = session.add(message["bytes"])
+                # Ucapan yang melebihi MAX_AUDIO_SECONDS langsung diakhiri agar buffer tetap terbatas
+                if session.total_bytes > MAX_AUDIO_SECONDS * session.bytes_per_second:
+                    endpoint = True
+            elif message.get("text"):
+                data, error = parse_config_message(message["text"])
+                if error:
+                    await websocket.send_json({"type": "error", "message": error})
+                    continue
+                if "sample_rate" in data or "format" in data:
+                    # Konfigurasi hanya berlaku sebelum frame audio pertama; setelah itu
+                    # membuat sesi baru akan membuang audio yang sudah di-buffer
+                    if audio_started:
+                        await websocket.send_json({"type": "error", "message": "Konfigurasi sample_rate/format hanya boleh dikirim sebelum audio"})
+                    else:
+                        session = StreamingSession(data.get("sample_rate", session.sample_rate))
+                        fmt = negotiate_format(requested=data.get("format") or fmt)
+                session_id = data.get("session_id") or session_id
+                endpoint = data.get("event") == "end"
+
+            if endpoint:
+                # Tunggu dekode parsial yang sedang berjalan agar buffer tidak berubah di tengah jalan
+                if decode_task is not None:
+                    await asyncio.wait([decode_task])
+                    _log_decode_error(decode_task)
+                    decode_task = None
+                await _stream_finalize(websocket, session, fmt, session_id)
+                session.reset()
+            elif session.partial_due() and (decode_task is None or decode_task.done()):
+                if decode_task is not None:
+                    _log_decode_error(decode_task)
+                # Dekode parsial berjalan di background sehingga frame tetap diterima
+                decode_task = asyncio.create_task(_stream_decode(websocket, session))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if decode_task is not None and not decode_task.done():
+            decode_task.cancel()
+        logger.info("Sesi WebSocket voice chat ditutup")
 
 # Untuk menjalankan aplikasi dengan uvicorn
 if __name__ == "__main__":
     import uvicorn
     logger.info("Memulai Voice Chatbot API")
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    # Dengan WEB_CONCURRENCY > 1 beberapa worker berbagi riwayat chat dan cache
+    # lewat backend state (STATE_BACKEND=sqlite untuk satu mesin, redis untuk banyak node).
+    # Mode reload hanya tersedia untuk satu worker.
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    reload = workers == 1 and os.getenv("UVICORN_RELOAD", "1") == "1"
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=reload, workers=workers)
@@ -0,0 +1,37 @@
+import threading
+from collections import defaultdict
+
+# Metrik sederhana per proses (counter dan ringkasan nilai), diekspos lewat /metrics.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_summaries = defaultdict(lambda: {"count": 0, "sum": 0.0, "max": 0.0})
+
+def _name(name: str, labels: dict = None) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+def increment(name: str, labels: dict = None, value: int = 1):
+    """Tambah counter `name` (opsional dengan label) sebesar `value`."""
+    with _lock:
+        _counters[_name(name, labels)] += value
+
+def observe(name: str, value: float, labels: dict = None):
+    """Catat satu observasi nilai (misalnya latensi dalam detik)."""
+    with _lock:
+        summary = _summaries[_name(name, labels)]
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["max"] = max(summary["max"], value)
+
+def snapshot() -> dict:
+    """Salinan semua metrik saat ini."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "summaries": {
+                name: {**s, "avg": s["sum"] / s["count"] if s["count"] else 0.0}
+                for name, s in _summaries.items()
+            },
+        }
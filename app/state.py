@@ -0,0 +1,287 @@
+import os
+import asyncio
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Backend state bersama: "sqlite" (default, dipakai bersama oleh semua worker dalam
+# satu mesin), "memory" (hanya satu proses), atau "redis" (banyak worker/node).
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", os.path.join(BASE_DIR, "state.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "voicechat:")
+
+# Lama maksimum sebuah lock dipegang sebelum dianggap kedaluwarsa (misalnya worker mati)
+LOCK_TTL_SECONDS = float(os.getenv("STATE_LOCK_TTL_SECONDS", "120"))
+LOCK_POLL_SECONDS = 0.05
+
+# Sebagian besar kunci hanya ditulis sekali (hasil idempoten, cache TTS/LLM) sehingga
+# entri kedaluwarsa tidak akan dibaca lagi. Entri tersebut dihapus oleh set() paling
+# sering sekali setiap interval ini.
+STATE_SWEEP_INTERVAL_SECONDS = float(os.getenv("STATE_SWEEP_INTERVAL_SECONDS", "60"))
+
+def _to_bytes(value) -> bytes:
+    return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+
+class StateBackend:
+    """
+    Antarmuka penyimpanan key-value bersama untuk sesi, riwayat chat, dan cache.
+    Nilai selalu dikembalikan sebagai bytes; ttl dalam detik (None = tanpa kedaluwarsa).
+    """
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: float = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def _acquire(self, name: str, token: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def _purge_expired(self, now: float):
+        """Hapus semua entri kedaluwarsa. Backend dengan TTL bawaan tidak perlu mengisinya."""
+
+    _last_sweep = 0.0
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep >= STATE_SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = now
+            self._purge_expired(now)
+
+    def _release(self, name: str, token: str):
+        raise NotImplementedError
+
+    def acquire(self, name: str, ttl: float = LOCK_TTL_SECONDS, timeout: float = None) -> str:
+        """
+        Ambil lock terdistribusi, menunggu hingga tersedia atau timeout.
+        Returns:
+            str: Token yang diperlukan untuk release()
+        Raises:
+            TimeoutError: jika lock tidak didapat dalam `timeout` detik
+        """
+        token = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._acquire(name, token, ttl):
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Gagal mendapatkan lock {name}")
+            time.sleep(LOCK_POLL_SECONDS)
+        return token
+
+    async def acquire_async(self, name: str, ttl: float = LOCK_TTL_SECONDS, timeout: float = None) -> str:
+        """
+        Seperti acquire(), tetapi menunggu dengan asyncio.sleep sehingga tidak
+        menahan thread executor selama lock dipegang worker lain. Hanya satu
+        percobaan _acquire (yang singkat) yang dijalankan di thread.
+        """
+        token = uuid.uuid4().hex
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not await asyncio.to_thread(self._acquire, name, token, ttl):
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Gagal mendapatkan lock {name}")
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+        return token
+
+    def release(self, name: str, token: str):
+        """Lepas lock yang didapat dari acquire()."""
+        self._release(name, token)
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = LOCK_TTL_SECONDS, timeout: float = None):
+        """Lock terdistribusi sederhana sebagai context manager (lihat acquire())."""
+        token = self.acquire(name, ttl, timeout)
+        try:
+            yield
+        finally:
+            self.release(name, token)
+
+class MemoryBackend(StateBackend):
+    """Backend dalam memori proses. Hanya cocok untuk deployment satu worker."""
+
+    def __init__(self):
+        self._data = {}
+        self._mutex = threading.Lock()
+
+    def get(self, key):
+        with self._mutex:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else time.time() + ttl
+        with self._mutex:
+            self._data[key] = (_to_bytes(value), expires)
+        self._maybe_sweep()
+
+    def _purge_expired(self, now):
+        with self._mutex:
+            expired = [key for key, (_, expires) in self._data.items() if expires is not None and expires < now]
+            for key in expired:
+                del self._data[key]
+
+    def delete(self, key):
+        with self._mutex:
+            self._data.pop(key, None)
+
+    def _acquire(self, name, token, ttl):
+        with self._mutex:
+            item = self._data.get(name)
+            if item is not None and (item[1] is None or item[1] >= time.time()):
+                return False
+            self._data[name] = (token.encode("ascii"), time.time() + ttl)
+            return True
+
+    def _release(self, name, token):
+        with self._mutex:
+            item = self._data.get(name)
+            if item is not None and item[0] == token.encode("ascii"):
+                del self._data[name]
+
+class SQLiteBackend(StateBackend):
+    """
+    Backend SQLite (mode WAL). Satu file database dipakai bersama oleh semua
+    worker uvicorn/gunicorn di mesin yang sama.
+    """
+
+    def __init__(self, path: str = STATE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Koneksi SQLite tidak boleh dipakai lintas thread, jadi satu koneksi per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value, expires FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] < time.time():
+            self.delete(key)
+            return None
+        return bytes(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires = None if ttl is None else time.time() + ttl
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+            (key, _to_bytes(value), expires),
+        )
+        self._maybe_sweep()
+
+    def _purge_expired(self, now):
+        self._connect().execute("DELETE FROM kv WHERE expires < ?", (now,))
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _acquire(self, name, token, ttl):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires < ?", (name, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                (name, token.encode("ascii"), now + ttl),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def _release(self, name, token):
+        self._connect().execute(
+            "DELETE FROM kv WHERE key = ? AND value = ?", (name, token.encode("ascii"))
+        )
+
+_REDIS_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class RedisBackend(StateBackend):
+    """
+    Backend Redis untuk deployment banyak node. `client` bisa diisi objek lain
+    yang kompatibel dengan redis-py (misalnya fakeredis dengan dukungan Lua) untuk
+    pengujian lokal. Kedaluwarsa memakai TTL bawaan Redis.
+    """
+
+    def __init__(self, url: str = REDIS_URL, client=None, prefix: str = STATE_KEY_PREFIX):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def get(self, key):
+        return self.client.get(self._key(key))
+
+    def set(self, key, value, ttl=None):
+        px = None if ttl is None else max(1, int(ttl * 1000))
+        self.client.set(self._key(key), _to_bytes(value), px=px)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def _acquire(self, name, token, ttl):
+        return bool(self.client.set(self._key(name), token, nx=True, px=int(ttl * 1000)))
+
+    def _release(self, name, token):
+        # Hapus hanya jika lock masih milik kita, dalam satu operasi atomik di server
+        self.client.eval(_REDIS_RELEASE_SCRIPT, 1, self._key(name), token)
+
+_BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+    "redis": RedisBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> StateBackend:
+    """Kembalikan backend state sesuai STATE_BACKEND, dibuat pada pemanggilan pertama."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STATE_BACKEND not in _BACKENDS:
+                    raise ValueError(f"STATE_BACKEND tidak dikenal: {STATE_BACKEND}. Pilihan: {', '.join(_BACKENDS)}")
+                _backend = _BACKENDS[STATE_BACKEND]()
+    return _backend
+
+def set_backend(backend: StateBackend):
+    """Ganti backend state (misalnya untuk pengujian dengan fakeredis)."""
+    global _backend
+    _backend = backend
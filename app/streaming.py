@@ -0,0 +1,130 @@
+import os
+import json
+
+import numpy as np
+
+from app.vad import EnergyVAD, VAD_FRAME_MS, frame_rms, pcm16_to_float
+from app.stt import stitch_transcripts, STT_CHUNK_OVERLAP_SECONDS
+
+# Panjang maksimum audio yang belum di-commit. Jika terlampaui, potongan awal
+# didekode sekali lalu teksnya di-commit sehingga setiap dekode parsial dan
+# dekode final hanya memproses paling banyak satu jendela audio.
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "10"))
+
+# Titik potong jendela dicari di frame paling hening dalam rentang ini sebelum
+# batas jendela, agar kata tidak terpotong di tengah
+STREAM_SPLIT_SEARCH_SECONDS = float(os.getenv("STREAM_SPLIT_SEARCH_SECONDS", "2.0"))
+
+# Interval minimal audio baru sebelum transkrip parsial berikutnya dikirim
+STREAM_PARTIAL_INTERVAL_SECONDS = float(os.getenv("STREAM_PARTIAL_INTERVAL_SECONDS", "1.0"))
+
+# Rentang sample_rate yang diterima dari pesan konfigurasi klien
+STREAM_MIN_SAMPLE_RATE = 8000
+STREAM_MAX_SAMPLE_RATE = 48000
+
+def parse_config_message(text: str):
+    """
+    Validasi pesan teks dari klien WebSocket.
+    Args:
+        text (str): Isi pesan teks (JSON object, atau nama event polos seperti "end")
+    Returns:
+        tuple: (dict pesan, None) jika valid, atau (None, pesan error)
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = {"event": text.strip()}
+    if not isinstance(data, dict):
+        return None, "Pesan teks harus berupa JSON object"
+
+    if "sample_rate" in data:
+        sample_rate = data["sample_rate"]
+        if (isinstance(sample_rate, bool) or not isinstance(sample_rate, int)
+                or not STREAM_MIN_SAMPLE_RATE <= sample_rate <= STREAM_MAX_SAMPLE_RATE):
+            return None, (f"sample_rate harus bilangan bulat antara {STREAM_MIN_SAMPLE_RATE} "
+                          f"dan {STREAM_MAX_SAMPLE_RATE}")
+    for key in ("format", "session_id", "event"):
+        if data.get(key) is not None and not isinstance(data[key], str):
+            return None, f"{key} harus berupa string"
+    return data, None
+
+class StreamingSession:
+    """
+    Status satu ucapan pada WebSocket streaming STT: buffer PCM yang belum
+    di-commit, teks yang sudah di-commit, dan VAD untuk endpointing.
+    Dekode (yang memblokir) dilakukan pemanggil dari thread lain memakai
+    snapshot(), lalu hasilnya diterapkan dengan commit().
+    """
+
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self.bytes_per_second = sample_rate * 2
+        self.window_bytes = int(STREAM_WINDOW_SECONDS * self.bytes_per_second)
+        self.partial_interval_bytes = int(STREAM_PARTIAL_INTERVAL_SECONDS * self.bytes_per_second)
+        self.search_bytes = min(self.window_bytes // 2, int(STREAM_SPLIT_SEARCH_SECONDS * self.bytes_per_second))
+        self.overlap_bytes = int(STT_CHUNK_OVERLAP_SECONDS * self.sample_rate) * 2
+        self.vad = EnergyVAD(sample_rate)
+        self.reset()
+
+    def reset(self):
+        self.pcm = bytearray()
+        self.committed = []
+        self.total_bytes = 0
+        self.last_partial_bytes = 0
+        self.vad.reset()
+
+    def add(self, pcm: bytes) -> bool:
+        """
+        Tambahkan frame PCM baru.
+        Returns:
+            bool: True jika VAD mendeteksi akhir ucapan
+        """
+        # Jaga agar buffer selalu berisi sampel 16-bit utuh
+        if len(pcm) % 2:
+            pcm = pcm[:-1]
+        self.pcm.extend(pcm)
+        self.total_bytes += len(pcm)
+        return self.vad.process(pcm)
+
+    @property
+    def has_speech(self) -> bool:
+        return self.vad.speech_started
+
+    def partial_due(self) -> bool:
+        return (self.has_speech
+                and self.total_bytes - self.last_partial_bytes >= self.partial_interval_bytes)
+
+    def needs_commit(self) -> bool:
+        return len(self.pcm) > self.window_bytes
+
+    def next_window(self):
+        """
+        Tentukan jendela berikutnya yang akan di-commit.
+        Returns:
+            tuple: (jumlah byte yang didekode, jumlah byte yang di-commit). Byte yang
+            didekode menyertakan overlap setelah titik potong; overlap itu didekode
+            lagi di awal jendela berikutnya dan kata gandanya dibuang saat digabung.
+        """
+        lo = self.window_bytes - self.search_bytes
+        rms = frame_rms(pcm16_to_float(bytes(self.pcm[lo:self.window_bytes])), self.sample_rate)
+        cut = self.window_bytes
+        if rms.size:
+            frame_bytes = max(1, int(self.sample_rate * VAD_FRAME_MS / 1000)) * 2
+            cut = lo + int(np.argmin(rms)) * frame_bytes
+        cut = max(2, cut)
+        return min(len(self.pcm), cut + self.overlap_bytes), cut
+
+    def snapshot(self, limit: int = None) -> bytes:
+        """Salinan audio yang belum di-commit (opsional hanya `limit` byte pertama)."""
+        self.last_partial_bytes = self.total_bytes
+        return bytes(self.pcm[:limit] if limit else self.pcm)
+
+    def commit(self, n_bytes: int, text: str):
+        """Buang `n_bytes` audio pertama dari buffer dan simpan teks hasil dekodenya."""
+        del self.pcm[:n_bytes]
+        if text:
+            self.committed.append(text)
+
+    def text_with(self, tail_text: str) -> str:
+        """Gabungkan teks yang sudah di-commit dengan hasil dekode ekor buffer."""
+        return stitch_transcripts(self.committed + [tail_text])
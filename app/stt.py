@@ -1,7 +1,22 @@
 import os
+import logging
+import json
 import uuid
 import tempfile
+import threading
 import subprocess
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from app import metrics, cpu
+from app.audio_codec import pcm16_to_wav_bytes, wav_duration_seconds
+from app.vad import find_silence_splits, read_wav_pcm16
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -16,6 +31,173 @@ WHISPER_BINARY = os.path.join(WHISPER_DIR, "build", "bin", "Release", "whisper-c
 # Gunakan os.path.join() untuk mengarah ke file model di dalam folder "models"
 WHISPER_MODEL_PATH = os.path.join(WHISPER_DIR, "models", "ggml-large-v3-turbo.bin")
 
+# === Tiering model STT ===
+# Model Whisper yang bisa dipilih router, urut dari yang tercepat ke yang paling akurat.
+# Nilai ketiga adalah perkiraan real-time factor (detik proses per detik audio).
+WHISPER_MODEL_TIERS = [
+    ("tiny", os.path.join(WHISPER_DIR, "models", "ggml-tiny.bin"), 0.05),
+    ("base", os.path.join(WHISPER_DIR, "models", "ggml-base.bin"), 0.08),
+    ("small", os.path.join(WHISPER_DIR, "models", "ggml-small.bin"), 0.2),
+    ("large-turbo", WHISPER_MODEL_PATH, 0.5),
+]
+
+# Tier yang diaktifkan (dipisah koma). Tier yang file modelnya tidak ada dilewati.
+STT_MODEL_TIERS = os.getenv("STT_MODEL_TIERS", "tiny,base,small,large-turbo").split(",")
+
+# Target latensi STT per klip; router memilih model terbesar yang diperkirakan memenuhinya
+STT_LATENCY_SLO_SECONDS = float(os.getenv("STT_LATENCY_SLO_SECONDS", "3.0"))
+
+# Klip sependek ini (misalnya "halo") langsung memakai STT_SHORT_CLIP_TIER
+STT_SHORT_CLIP_SECONDS = float(os.getenv("STT_SHORT_CLIP_SECONDS", "2.0"))
+STT_SHORT_CLIP_TIER = os.getenv("STT_SHORT_CLIP_TIER", "base")
+
+# Tier untuk transkrip parsial WebSocket streaming. Parsial dikirim berulang dan
+# segera digantikan, jadi tidak melewati router, tidak dihitung di queue_depth(),
+# dan tidak diulang dengan model terbesar. Kosong = tier aktif terkecil.
+STT_STREAM_TIER = os.getenv("STT_STREAM_TIER", "")
+
+# Durasi yang diasumsikan jika durasi klip tidak bisa dibaca dari header
+STT_ASSUMED_DURATION_SECONDS = float(os.getenv("STT_ASSUMED_DURATION_SECONDS", "10"))
+
+# Jumlah transkripsi yang bisa berjalan paralel tanpa saling memperlambat
+STT_PARALLELISM = int(os.getenv("STT_PARALLELISM", str(max(1, (os.cpu_count() or 1) // 4))))
+
+# Hasil dengan rata-rata probabilitas token di bawah ini diulang dengan model terbesar.
+# Set 0 untuk menonaktifkan.
+STT_RERUN_CONFIDENCE = float(os.getenv("STT_RERUN_CONFIDENCE", "0.6"))
+
+# Segmen whisper dengan rata-rata probabilitas token di bawah ini, atau dengan
+# no_speech_prob di atas STT_NO_SPEECH_THRESHOLD, dibuang sebelum teks dikirim ke LLM.
+# Segmen seperti ini biasanya halusinasi dari keheningan atau derau.
+STT_SEGMENT_MIN_CONFIDENCE = float(os.getenv("STT_SEGMENT_MIN_CONFIDENCE", "0.3"))
+STT_NO_SPEECH_THRESHOLD = float(os.getenv("STT_NO_SPEECH_THRESHOLD", "0.6"))
+
+# === Transkripsi paralel untuk rekaman panjang ===
+# Rekaman WAV lebih panjang dari STT_CHUNK_MIN_SECONDS dipotong di titik hening menjadi
+# segmen sekitar STT_CHUNK_TARGET_SECONDS, ditranskrip paralel, lalu disambung berurutan.
+STT_CHUNK_MIN_SECONDS = float(os.getenv("STT_CHUNK_MIN_SECONDS", "30"))
+STT_CHUNK_TARGET_SECONDS = float(os.getenv("STT_CHUNK_TARGET_SECONDS", "20"))
+STT_CHUNK_SEARCH_SECONDS = float(os.getenv("STT_CHUNK_SEARCH_SECONDS", "5"))
+# Audio tambahan di kedua sisi batas segmen; kata ganda di sambungan dibuang saat stitching
+STT_CHUNK_OVERLAP_SECONDS = float(os.getenv("STT_CHUNK_OVERLAP_SECONDS", "0.5"))
+# Jumlah kata maksimum yang dicek sebagai duplikat di setiap sambungan
+STT_STITCH_MAX_WORDS = 6
+
+_stt_executor = ThreadPoolExecutor(max_workers=STT_PARALLELISM, thread_name_prefix="stt")
+
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+@contextmanager
+def _track_inflight():
+    global _inflight
+    with _inflight_lock:
+        _inflight += 1
+    try:
+        yield
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
+
+def queue_depth() -> int:
+    """Jumlah transkripsi yang sedang berjalan di proses ini."""
+    return _inflight
+
+def available_tiers() -> list:
+    """Tier aktif yang file modelnya tersedia, urut dari kecil ke besar."""
+    return [
+        (name, path, rtf) for name, path, rtf in WHISPER_MODEL_TIERS
+        if name in STT_MODEL_TIERS and os.path.exists(path)
+    ]
+
+def route_model(duration: float, depth: int):
+    """
+    Pilih model Whisper untuk satu klip.
+    Args:
+        duration (float): Durasi klip (detik), None jika tidak diketahui
+        depth (int): Jumlah transkripsi lain yang sedang berjalan
+    Returns:
+        tuple: (nama tier, path model, alasan)
+    """
+    tiers = available_tiers()
+    if not tiers:
+        # Tidak ada tier yang tersedia: pakai model default seperti sebelumnya
+        return "large-turbo", WHISPER_MODEL_PATH, "default"
+
+    if duration is not None and duration <= STT_SHORT_CLIP_SECONDS:
+        for name, path, _ in tiers:
+            if name == STT_SHORT_CLIP_TIER:
+                return name, path, "short_clip"
+
+    if duration is None:
+        duration = STT_ASSUMED_DURATION_SECONDS
+    # Antrean memperlambat setiap klip kira-kira sebanding dengan beban per slot paralel
+    load_factor = 1.0 + depth / STT_PARALLELISM
+    for name, path, rtf in reversed(tiers):
+        if rtf * duration * load_factor <= STT_LATENCY_SLO_SECONDS:
+            return name, path, "slo"
+
+    name, path, _ = tiers[0]
+    return name, path, "overload"
+
+def _run_whisper(audio_path: str, model_path: str, tmpdir: str):
+    """
+    Jalankan whisper-cli dan baca hasil JSON lengkapnya.
+    Returns:
+        tuple: (teks, rata-rata probabilitas token) atau ("[ERROR] ...", 0.0)
+    """
+    output_base = os.path.join(tmpdir, f"transcription_{uuid.uuid4()}")
+    try:
+        # Jumlah thread whisper mengikuti jatah dari scheduler CPU agar transkripsi
+        # yang berjalan bersamaan (dan proses TTS) tidak berebut core
+        with cpu.scheduler.job("stt") as budget:
+            cmd = [
+                WHISPER_BINARY,
+                "-m", model_path,
+                "-f", audio_path,
+                "-t", str(budget.threads),
+                "-ojf",
+                "-of", output_base
+            ]
+            # Output whisper-cli ditangkap (bukan langsung ke konsol) dan hanya dicatat di level DEBUG
+            result = cpu.run(cmd, budget)
+        logger.debug("Whisper selesai", extra={"stderr": result.stderr, "threads": budget.threads})
+    except subprocess.CalledProcessError as e:
+        logger.error("Whisper failed: %s", e, extra={"stderr": e.stderr})
+        return f"[ERROR] Whisper failed: {e}", 0.0
+
+    try:
+        with open(f"{output_base}.json", "r", encoding="utf-8") as result_file:
+            result = json.load(result_file)
+    except FileNotFoundError:
+        return "[ERROR] Transcription file not found", 0.0
+
+    kept_text, probs = [], []
+    for segment in result.get("transcription", []):
+        # Token khusus seperti [_BEG_] dan [_TT_...] tidak ikut dihitung
+        segment_probs = [
+            token["p"] for token in segment.get("tokens", [])
+            if "p" in token and not token.get("text", "").startswith("[_")
+        ]
+        if _is_noise_segment(segment, segment_probs):
+            metrics.increment("stt_segment_dropped_total")
+            logger.debug("Segmen whisper dibuang", extra={"segment_text": segment.get("text", "")})
+            continue
+        kept_text.append(segment.get("text", ""))
+        probs.extend(segment_probs)
+
+    text = "".join(kept_text).strip()
+    confidence = sum(probs) / len(probs) if probs else 0.0
+    return text, confidence
+
+def _is_noise_segment(segment: dict, probs: list) -> bool:
+    """Segmen tanpa ucapan atau dengan keyakinan terlalu rendah."""
+    if segment.get("no_speech_prob", 0.0) > STT_NO_SPEECH_THRESHOLD:
+        return True
+    if not probs:
+        return not segment.get("text", "").strip()
+    return sum(probs) / len(probs) < STT_SEGMENT_MIN_CONFIDENCE
+
 def transcribe_speech_to_text(file_bytes: bytes, file_ext: str = ".wav") -> str:
     """
     Transkrip file audio menggunakan whisper.cpp CLI
@@ -27,29 +209,247 @@ def transcribe_speech_to_text(file_bytes: bytes, file_ext: str = ".wav") -> str:
     """
     with tempfile.TemporaryDirectory() as tmpdir:
         audio_path = os.path.join(tmpdir, f"{uuid.uuid4()}{file_ext}")
-        result_path = os.path.join(os.path.dirname(tmpdir), "transcription.txt")
 
         # simpan audio ke file temporer
         with open(audio_path, "wb") as f:
             f.write(file_bytes)
 
-        # jalankan whisper.cpp dengan subprocess
-        cmd = [
-            WHISPER_BINARY,
-            "-m", WHISPER_MODEL_PATH,
-            "-f", audio_path,
-            "-otxt",
-            "-of", os.path.join(os.path.dirname(tmpdir), "transcription")
-        ]
+        return transcribe_speech_file(audio_path)
+
+def transcribe_speech_file(audio_path: str) -> str:
+    """
+    Transkrip file audio yang sudah ada di disk (misalnya upload yang di-stream
+    langsung ke file).
+    Args:
+        audio_path (str): Path file audio
+    Returns:
+        str: Teks hasil transkripsi
+    """
+    text, _ = transcribe_speech_file_with_info(audio_path)
+    return text
+
+def transcribe_speech_file_with_info(audio_path: str):
+    """
+    Seperti transcribe_speech_file, tetapi juga mengembalikan informasi pemrosesan.
+    Rekaman panjang dipotong di titik hening dan ditranskrip paralel.
+    Returns:
+        tuple: (teks, {"segments": int, "parallelism": float, "duration": float | None}).
+            parallelism adalah total waktu proses semua segmen dibagi waktu tunggu,
+            yaitu rata-rata jumlah segmen yang berjalan bersamaan (1.0 = berurutan),
+            bukan percepatan terhadap satu kali transkripsi utuh.
+    """
+    is_wav = audio_path.lower().endswith(".wav")
+    duration = wav_duration_seconds(audio_path) if is_wav else None
+
+    if duration is None or duration <= STT_CHUNK_MIN_SECONDS:
+        text = _transcribe_single(audio_path, duration)
+        return text, {"segments": 1, "parallelism": 1.0, "duration": duration}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        segment_paths = _split_wav(audio_path, tmpdir)
+        if segment_paths is None:
+            text = _transcribe_single(audio_path, duration)
+            return text, {"segments": 1, "parallelism": 1.0, "duration": duration}
+
+        # Model dipilih sekali untuk seluruh rekaman. Segmen rekaman ini sendiri tidak
+        # dihitung sebagai beban; durasi efektifnya adalah bagian per slot paralel.
+        slots = min(len(segment_paths), STT_PARALLELISM)
+        tier, model_path, reason = _route(duration / slots)
+
+        start = time.perf_counter()
+        results = _transcribe_segments(segment_paths, model_path)
+        wall = time.perf_counter() - start
+
+        for text, _, _ in results:
+            if text.startswith("[ERROR]"):
+                return text, {"segments": len(results), "parallelism": 1.0, "duration": duration}
+
+        # Keyakinan rendah diulang sekali untuk seluruh rekaman (semua segmen paralel),
+        # bukan per segmen secara berurutan
+        confidences = [confidence for text, confidence, _ in results if text]
+        confidence = sum(confidences) / len(confidences) if confidences else 1.0
+        largest = _rerun_tier(tier, confidence)
+        if largest is not None:
+            metrics.increment("stt_rerun_total", {"from": tier, "to": largest[0]})
+            rerun = _transcribe_segments(segment_paths, largest[1])
+            if not any(text.startswith("[ERROR]") for text, _, _ in rerun):
+                results = rerun
+            wall = time.perf_counter() - start
+
+    parallelism = sum(elapsed for _, _, elapsed in results) / wall if wall > 0 else 1.0
+    metrics.increment("stt_chunked_total")
+    metrics.observe("stt_chunk_segments", len(results))
+    metrics.observe("stt_chunk_parallelism", parallelism)
+    logger.info("Transkripsi paralel selesai", extra={"segments": len(results), "tier": tier, "parallelism": round(parallelism, 2), "duration": duration})
+    return stitch_transcripts([text for text, _, _ in results]), {
+        "segments": len(results), "parallelism": parallelism, "duration": duration,
+    }
+
+def _transcribe_segments(segment_paths: list, model_path: str) -> list:
+    """Transkrip semua segmen paralel di _stt_executor; urutan hasil mengikuti segmen."""
+    futures = [
+        _stt_executor.submit(contextvars.copy_context().run, _transcribe_segment, path, model_path)
+        for path, _ in segment_paths
+    ]
+    return [future.result() for future in futures]
+
+def _transcribe_segment(audio_path: str, model_path: str):
+    """
+    Returns:
+        tuple: (teks, rata-rata probabilitas token, lama proses dalam detik)
+    """
+    start = time.perf_counter()
+    with _track_inflight(), tempfile.TemporaryDirectory() as tmpdir:
+        text, confidence = _run_whisper(audio_path, model_path, tmpdir)
+    return text, confidence, time.perf_counter() - start
+
+def _split_wav(audio_path: str, tmpdir: str):
+    """
+    Potong WAV di titik hening menjadi file-file segmen mono (dengan overlap).
+    Returns:
+        list | None: [(path segmen, durasi)], atau None jika format tidak didukung
+    """
+    wav = read_wav_pcm16(audio_path)
+    if wav is None:
+        return None
+    pcm, sample_rate = wav
+
+    samples = pcm.astype(np.float32) / 32768.0
+    cuts = find_silence_splits(samples, sample_rate, STT_CHUNK_TARGET_SECONDS, STT_CHUNK_SEARCH_SECONDS)
+    overlap = int(STT_CHUNK_OVERLAP_SECONDS * sample_rate)
+
+    segments = []
+    for i, (begin, end) in enumerate(zip(cuts[:-1], cuts[1:])):
+        begin = max(0, begin - overlap)
+        end = min(len(pcm), end + overlap)
+        path = os.path.join(tmpdir, f"segment_{i:03d}.wav")
+        with open(path, "wb") as f:
+            f.write(pcm16_to_wav_bytes(pcm[begin:end].tobytes(), sample_rate))
+        segments.append((path, (end - begin) / sample_rate))
+    return segments
+
+def _normalize_word(word: str) -> str:
+    return word.strip(".,!?;:\"'()").lower()
+
+def stitch_transcripts(texts: list) -> str:
+    """
+    Sambung transkrip segmen berurutan. Kata yang muncul dua kali karena overlap
+    audio di batas segmen (akhir segmen sebelumnya == awal segmen berikutnya) dibuang.
+    """
+    words = []
+    for text in texts:
+        next_words = text.split()
+        if not next_words:
+            continue
+        max_k = min(STT_STITCH_MAX_WORDS, len(words), len(next_words))
+        for k in range(max_k, 0, -1):
+            tail = [_normalize_word(w) for w in words[-k:]]
+            head = [_normalize_word(w) for w in next_words[:k]]
+            if tail == head:
+                next_words = next_words[k:]
+                break
+        words.extend(next_words)
+    return " ".join(words)
+
+def _route(duration: float):
+    """Pilih model dengan route_model berdasarkan beban saat ini, lalu catat keputusannya."""
+    depth = queue_depth()
+    tier, model_path, reason = route_model(duration, depth)
+    metrics.increment("stt_route_total", {"tier": tier, "reason": reason})
+    logger.info("STT routing", extra={"tier": tier, "reason": reason, "duration": duration, "queue_depth": depth})
+    return tier, model_path, reason
+
+def _rerun_tier(tier: str, confidence: float):
+    """Tier terbesar jika hasil dari `tier` perlu diulang karena keyakinan rendah, selain itu None."""
+    tiers = available_tiers()
+    largest = tiers[-1] if tiers else None
+    if (STT_RERUN_CONFIDENCE > 0 and largest is not None and largest[0] != tier
+            and confidence < STT_RERUN_CONFIDENCE):
+        return largest
+    return None
+
+def _transcribe_single(audio_path: str, duration: float) -> str:
+    """Transkrip satu file dengan model pilihan router (lihat route_model)."""
+    tier, model_path, reason = _route(duration)
+    with _track_inflight(), tempfile.TemporaryDirectory() as tmpdir:
+        text, confidence = _run_whisper(audio_path, model_path, tmpdir)
+        # Teks kosong berarti semua segmen dibuang sebagai derau; model besar tidak perlu dicoba
+        if text.startswith("[ERROR]") or not text:
+            return text
+        metrics.observe("stt_confidence", confidence, {"tier": tier})
+
+        # Hasil kurang yakin dari model kecil diulang dengan model terbesar
+        largest = _rerun_tier(tier, confidence)
+        if largest is not None:
+            metrics.increment("stt_rerun_total", {"from": tier, "to": largest[0]})
+            rerun_text, _ = _run_whisper(audio_path, largest[1], tmpdir)
+            if not rerun_text.startswith("[ERROR]"):
+                return rerun_text
+
+        return text
+
+def transcribe_pcm(pcm: bytes, sample_rate: int = 16000) -> str:
+    """
+    Transkrip audio PCM 16-bit mono mentah (misalnya dari WebSocket streaming).
+    Args:
+        pcm (bytes): Sampel PCM 16-bit little-endian
+        sample_rate (int): Sample rate audio
+    Returns:
+        str: Teks hasil transkripsi
+    """
+    return transcribe_speech_to_text(pcm16_to_wav_bytes(pcm, sample_rate), ".wav")
+
+def _stream_model_path() -> str:
+    tiers = available_tiers()
+    for name, path, _ in tiers:
+        if name == STT_STREAM_TIER:
+            return path
+    return tiers[0][1] if tiers else WHISPER_MODEL_PATH
+
+def transcribe_pcm_partial(pcm: bytes, sample_rate: int = 16000) -> str:
+    """
+    Transkrip cepat untuk hasil parsial streaming dengan tier STT_STREAM_TIER,
+    tanpa routing, metrik antrean, maupun pengulangan dengan model terbesar.
+    Args:
+        pcm (bytes): Sampel PCM 16-bit little-endian
+        sample_rate (int): Sample rate audio
+    Returns:
+        str: Teks hasil transkripsi
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_path = os.path.join(tmpdir, f"{uuid.uuid4()}.wav")
+        with open(audio_path, "wb") as f:
+            f.write(pcm16_to_wav_bytes(pcm, sample_rate))
+        text, _ = _run_whisper(audio_path, _stream_model_path(), tmpdir)
+        return text
+
+# === Warm-up ===
+# whisper-cli memuat model dari disk setiap kali dijalankan. Satu inferensi dummy saat
+# startup memastikan binary dan model valid serta file model sudah berada di page cache,
+# sehingga permintaan pertama tidak membayar biaya cold start.
+_is_warm = False
+
+def warm_up() -> bool:
+    """
+    Jalankan satu transkripsi dummy per tier model untuk memanaskan Whisper.
+    Returns:
+        bool: True jika model siap digunakan
+    """
+    global _is_warm
+    if not (os.path.exists(WHISPER_BINARY) and os.path.exists(WHISPER_MODEL_PATH)):
+        logger.error("Whisper binary/model tidak ditemukan: %s, %s", WHISPER_BINARY, WHISPER_MODEL_PATH)
+        return False
+
+    silence = pcm16_to_wav_bytes(b"\x00\x00" * 16000)
+    model_paths = [path for _, path, _ in available_tiers()] or [WHISPER_MODEL_PATH]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_path = os.path.join(tmpdir, "warmup.wav")
+        with open(audio_path, "wb") as f:
+            f.write(silence)
+        results = [_run_whisper(audio_path, path, tmpdir)[0] for path in model_paths]
+
+    _is_warm = not any(result.startswith("[ERROR]") for result in results)
+    return _is_warm
 
-        try:
-            subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            return f"[ERROR] Whisper failed: {e}"
-        
-        # baca hasil transkripsi
-        try:
-            with open(result_path, "r", encoding="utf-8") as result_file:
-                return result_file.read()
-        except FileNotFoundError:
-            return "[ERROR] Transcription file not found"
\ No newline at end of file
+def is_warm() -> bool:
+    return _is_warm
@@ -0,0 +1,268 @@
+import os
+import logging
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Ukuran maksimum leksikon fonem (jumlah kata unik) sebelum entri terlama dibuang
+PHONEME_CACHE_SIZE = int(os.getenv("PHONEME_CACHE_SIZE", "20000"))
+
+# Set TTS_PHONEMIZE=0 untuk mengirim teks ternormalisasi tanpa konversi fonem
+TTS_PHONEMIZE = os.getenv("TTS_PHONEMIZE", "1") != "0"
+
+SATUAN = ["", "satu", "dua", "tiga", "empat", "lima", "enam", "tujuh", "delapan", "sembilan",
+          "sepuluh", "sebelas"]
+
+SKALA = [
+    (10 ** 12, "triliun"),
+    (10 ** 9, "miliar"),
+    (10 ** 6, "juta"),
+    (1000, "ribu"),
+]
+
+NAMA_BULAN = ["januari", "februari", "maret", "april", "mei", "juni", "juli",
+              "agustus", "september", "oktober", "november", "desember"]
+
+# Singkatan umum dalam jawaban berbahasa Indonesia
+SINGKATAN = {
+    "dll": "dan lain-lain",
+    "dsb": "dan sebagainya",
+    "dst": "dan seterusnya",
+    "yg": "yang",
+    "dg": "dengan",
+    "dgn": "dengan",
+    "tdk": "tidak",
+    "utk": "untuk",
+    "krn": "karena",
+    "spt": "seperti",
+    "sbg": "sebagai",
+    "tsb": "tersebut",
+    "no": "nomor",
+    "jl": "jalan",
+    "prof": "profesor",
+    "dr": "dokter",
+    "km": "kilometer",
+    "m": "meter",
+    "cm": "sentimeter",
+    "kg": "kilogram",
+    "wib": "waktu indonesia barat",
+}
+
+# Singkatan yang selalu diikuti kata lain: titik sesudahnya bukan akhir kalimat.
+# Singkatan yang bisa menutup kalimat (dll., km., ...) tidak termasuk.
+SINGKATAN_TIDAK_AKHIR = {"dr", "jl", "no", "prof", "rp", "yg", "dg", "dgn", "tdk", "utk", "krn", "spt", "sbg"}
+
+SIMBOL = {
+    "%": " persen",
+    "&": " dan ",
+    "+": " tambah ",
+    "=": " sama dengan ",
+    "°C": " derajat celsius",
+    "°": " derajat",
+}
+
+_DATE_RE = re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4})\b")
+# Jam dikenali dari awalan "pukul"/"jam", pemisah ":", atau zona waktu sesudahnya
+# (lihat _expand_time); "10.30" tanpa penanda tersebut dibaca sebagai desimal.
+_TIME_RE = re.compile(r"\b((?:pukul|jam)\s+)?(\d{1,2})([:.])(\d{2})\b(?![.:]\d)", re.IGNORECASE)
+_TIME_ZONE_RE = re.compile(r"\s*(?:wib|wita|wit)\b", re.IGNORECASE)
+_CURRENCY_RE = re.compile(r"\bRp\.?\s*(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d+))?", re.IGNORECASE)
+# Desimal dengan koma (baku) atau titik; titik diikuti tepat tiga digit adalah pemisah ribuan
+_DECIMAL_RE = re.compile(r"\b(\d+),(\d+)\b|\b(\d+)\.(\d{1,2}|\d{4,})\b(?![.,]\d)")
+_NUMBER_RE = re.compile(r"\b\d{1,3}(?:\.\d{3})+\b|\b\d+\b")
+_ABBR_RE = re.compile(r"\b(" + "|".join(sorted(SINGKATAN, key=len, reverse=True)) + r")(?=[\s,.;:!?]|$)",
+                      re.IGNORECASE)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+_LAST_WORD_RE = re.compile(r"(\w+)\.$")
+_TOKEN_RE = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*|\w+|[^\w\s]|\s+")
+
+def _ratusan(n: int) -> str:
+    """Eja bilangan 0-999."""
+    words = []
+    ratus, sisa = divmod(n, 100)
+    if ratus == 1:
+        words.append("seratus")
+    elif ratus > 1:
+        words.append(f"{SATUAN[ratus]} ratus")
+
+    if sisa < 12:
+        words.append(SATUAN[sisa])
+    elif sisa < 20:
+        words.append(f"{SATUAN[sisa - 10]} belas")
+    else:
+        puluh, satuan = divmod(sisa, 10)
+        words.append(f"{SATUAN[puluh]} puluh")
+        words.append(SATUAN[satuan])
+    return " ".join(w for w in words if w)
+
+def number_to_words(n: int) -> str:
+    """
+    Eja bilangan bulat dalam Bahasa Indonesia.
+    Args:
+        n (int): Bilangan yang akan dieja
+    Returns:
+        str: Ejaan bilangan, misalnya 1250 -> "seribu dua ratus lima puluh"
+    """
+    if n == 0:
+        return "nol"
+    if n < 0:
+        return f"minus {number_to_words(-n)}"
+
+    words = []
+    for nilai, nama in SKALA:
+        jumlah, n = divmod(n, nilai)
+        if not jumlah:
+            continue
+        if nilai == 1000 and jumlah == 1:
+            words.append("seribu")
+        else:
+            words.append(f"{number_to_words(jumlah)} {nama}")
+    if n:
+        words.append(_ratusan(n))
+    return " ".join(words)
+
+def _digits_to_words(digits: str) -> str:
+    """Eja angka digit per digit (untuk bagian desimal)."""
+    return " ".join("nol" if d == "0" else SATUAN[int(d)] for d in digits)
+
+def _expand_date(match) -> str:
+    hari, bulan, tahun = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    if not 1 <= bulan <= 12:
+        return match.group(0)
+    return f"{number_to_words(hari)} {NAMA_BULAN[bulan - 1]} {number_to_words(tahun)}"
+
+def _expand_time(match) -> str:
+    prefix, separator = match.group(1), match.group(3)
+    if not prefix and separator != ":" and not _TIME_ZONE_RE.match(match.string, match.end()):
+        return match.group(0)
+    jam, menit = int(match.group(2)), int(match.group(4))
+    if jam > 24 or menit > 59:
+        return match.group(0)
+    if menit == 0:
+        return f"pukul {number_to_words(jam)}"
+    return f"pukul {number_to_words(jam)} lewat {number_to_words(menit)} menit"
+
+def _expand_currency(match) -> str:
+    rupiah = number_to_words(int(match.group(1).replace(".", "") or 0))
+    if match.group(2):
+        return f"{rupiah} koma {_digits_to_words(match.group(2))} rupiah"
+    return f"{rupiah} rupiah"
+
+def _expand_decimal(match) -> str:
+    bulat = match.group(1) or match.group(3)
+    pecahan = match.group(2) or match.group(4)
+    return f"{number_to_words(int(bulat))} koma {_digits_to_words(pecahan)}"
+
+def _expand_number(match) -> str:
+    return number_to_words(int(match.group(0).replace(".", "")))
+
+def normalize_text(text: str) -> str:
+    """
+    Normalisasi teks Bahasa Indonesia agar siap diucapkan: tanggal, jam, mata uang,
+    angka, simbol, dan singkatan diubah menjadi kata.
+    Args:
+        text (str): Teks mentah dari LLM
+    Returns:
+        str: Teks ternormalisasi
+    """
+    text = _DATE_RE.sub(_expand_date, text)
+    text = _TIME_RE.sub(_expand_time, text)
+    text = _CURRENCY_RE.sub(_expand_currency, text)
+    text = _DECIMAL_RE.sub(_expand_decimal, text)
+    text = _NUMBER_RE.sub(_expand_number, text)
+    for simbol, kata in SIMBOL.items():
+        text = text.replace(simbol, kata)
+    text = _ABBR_RE.sub(lambda m: SINGKATAN[m.group(1).lower()], text)
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+def split_sentences(text: str) -> list:
+    """
+    Pecah teks menjadi kalimat berdasarkan tanda akhir kalimat. Titik setelah
+    singkatan di SINGKATAN_TIDAK_AKHIR (misalnya "Rp.", "dr.", "Jl.") tidak memecah
+    kalimat, sehingga setiap kalimat tetap dinormalisasi dengan konteks yang utuh.
+    """
+    sentences = []
+    start = 0
+    text = text.strip()
+    for match in _SENTENCE_END_RE.finditer(text):
+        last_word = _LAST_WORD_RE.search(text, start, match.start())
+        if last_word and last_word.group(1).lower() in SINGKATAN_TIDAK_AKHIR:
+            continue
+        sentences.append(text[start:match.start()].strip())
+        start = match.end()
+    sentences.append(text[start:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+def strip_phrase_prefix(text: str, phrase: str):
+    """
+    Cocokkan frasa (termasuk tanda baca penutupnya) dengan awal teks.
+    Frasa yang diakhiri koma hanya cocok jika teks juga memakai koma di situ
+    ("Baik," tidak cocok dengan "Baik sekali ..."), dan frasa yang diakhiri tanda
+    akhir kalimat hanya cocok jika kalimat teks juga berakhir di situ.
+    Returns:
+        str | None: Sisa teks setelah frasa, atau None jika tidak cocok
+    """
+    text = text.strip()
+    phrase = phrase.strip()
+    if not phrase or not text.lower().startswith(phrase.lower()):
+        return None
+    rest = text[len(phrase):]
+    if phrase[-1] in ".,!?;:":
+        # Setelah tanda baca frasa harus ada spasi atau akhir teks (bukan "..." atau "3.5")
+        if rest and not rest[0].isspace():
+            return None
+    elif rest and (rest[0].isalnum() or rest[0] in ".,!?;:"):
+        # Frasa tanpa tanda baca hanya cocok sebagai frasa utuh yang disusul spasi
+        return None
+    return rest.strip()
+
+_g2p = None
+
+def _get_g2p():
+    """Muat model G2P (g2p-id) secara lazy. Mengembalikan None jika tidak tersedia."""
+    global _g2p
+    if _g2p is None:
+        try:
+            from g2p_id import G2P
+            _g2p = G2P()
+        except Exception as e:
+            logger.error("g2p-id tidak tersedia, fonemisasi dilewati: %s", e)
+            _g2p = False
+    return _g2p or None
+
+@lru_cache(maxsize=PHONEME_CACHE_SIZE)
+def word_to_phonemes(word: str) -> str:
+    """
+    Konversi satu kata (huruf kecil) ke fonem. Hasil dimemoisasi dengan LRU sehingga
+    kata yang sering muncul hanya dikonversi sekali.
+    """
+    g2p = _get_g2p()
+    if g2p is None:
+        return word
+    return g2p(word).strip()
+
+def text_to_phonemes(text: str) -> str:
+    """
+    Normalisasi teks lalu konversi setiap kata ke fonem melalui leksikon LRU.
+    Tanda baca dan spasi dipertahankan agar prosodi kalimat tidak berubah.
+    Args:
+        text (str): Teks mentah dari LLM
+    Returns:
+        str: Teks fonetik untuk model Coqui Indonesia
+    """
+    normalized = normalize_text(text)
+    if not TTS_PHONEMIZE:
+        return normalized
+
+    parts = []
+    for token in _TOKEN_RE.findall(normalized):
+        if token[0].isalpha():
+            parts.append(word_to_phonemes(token.lower()))
+        else:
+            parts.append(token)
+    return "".join(parts)
+
+def cache_info():
+    """Statistik leksikon fonem (hits, misses, maxsize, currsize)."""
+    return word_to_phonemes.cache_info()
@@ -1,7 +1,25 @@
 import os
+import logging
 import uuid
 import tempfile
+import shutil
 import subprocess
+import threading
+import time
+import wave
+import hashlib
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app import cpu
+from app.text_norm import text_to_phonemes, split_sentences, strip_phrase_prefix
+from app.audio_codec import encode_audio
+from app.state import get_backend
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__)) 
 
@@ -20,16 +38,288 @@ COQUI_CONFIG_PATH = os.path.join(COQUI_DIR, "config.json")
 # Pilih nama speaker yang sesuai dengan isi file speakers.pth (misalnya: "wibowo")
 COQUI_SPEAKER = "wibowo"
 
+# Teks pendek untuk inferensi dummy saat warm-up
+WARMUP_TEXT = "halo"
+
+# Jika TTS tidak dipakai lebih lama dari ini (detik), sintesis dummy dijalankan lagi
+# secara spekulatif sebelum jawaban LLM tiba agar cache model kembali hangat.
+TTS_IDLE_REWARM_SECONDS = float(os.getenv("TTS_IDLE_REWARM_SECONDS", "300"))
+
+# Balasan untuk rekaman yang kosong/hening (lihat app.vad.detect_silence). Termasuk
+# dalam FILLER_TEXTS sehingga audio-nya sudah siap tanpa sintesis saat dibutuhkan.
+NOT_HEARD_TEXT = "Maaf, suara Anda tidak terdengar. Silakan coba lagi."
+
+# Filler dan awalan kalimat yang sering muncul di jawaban. Audio-nya disintesis sekali
+# saat startup lalu disambung langsung ke jawaban tanpa kerja model tambahan.
+FILLER_TEXTS = [
+    "Baik,",
+    "Maaf, saya tidak tahu.",
+    "Tunggu sebentar.",
+    NOT_HEARD_TEXT,
+]
+FILLER_DIR = os.path.join(tempfile.gettempdir(), "tts_fillers")
+
+# Jumlah kalimat yang disintesis paralel dan jeda hening antar kalimat
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", str(min(4, os.cpu_count() or 1))))
+TTS_SENTENCE_GAP_MS = int(os.getenv("TTS_SENTENCE_GAP_MS", "150"))
+
+_tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+
+# Cache respons TTS: teks yang sama tidak disintesis ulang. Setiap entri menyimpan
+# path WAV dan hasil enkode (opus/mp3/...) yang pernah diminta klien.
+TTS_CACHE_SIZE = int(os.getenv("TTS_CACHE_SIZE", "128"))
+# Cache lokal (LRU per proses) didukung cache bersama di backend state agar
+# audio yang disintesis satu worker bisa dipakai ulang oleh worker lain.
+TTS_CACHE_TTL_SECONDS = float(os.getenv("TTS_CACHE_TTL_SECONDS", "3600"))
+
+_tts_cache = OrderedDict()  # kunci teks -> {"wav": path, "<format>": bytes}
+_cache_lock = threading.Lock()
+
+_is_warm = False
+_warm_lock = threading.Lock()
+_last_used = 0.0
+_fillers = {}  # kunci filler ternormalisasi -> path file WAV
+
+def warm_up() -> bool:
+    """
+    Jalankan satu sintesis dummy agar model Coqui dan dependensinya termuat
+    sebelum permintaan pertama, lalu siapkan pustaka filler.
+    Returns:
+        bool: True jika sintesis dummy berhasil
+    """
+    global _is_warm, _last_used
+    with _warm_lock:
+        path = _synthesize(WARMUP_TEXT)
+        if path.startswith("[ERROR]"):
+            _is_warm = False
+            return False
+
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        _is_warm = True
+        _last_used = time.monotonic()
+
+    prepare_fillers()
+    return True
+
+def is_warm() -> bool:
+    return _is_warm
+
+def speculative_warm_up():
+    """
+    Panaskan ulang TTS di background jika sudah lama idle. Dipanggil saat LLM
+    mulai berpikir sehingga waktu tunggu Gemini dimanfaatkan untuk warm-up.
+    """
+    if time.monotonic() - _last_used < TTS_IDLE_REWARM_SECONDS:
+        return
+    # Lewati jika warm-up lain sedang berjalan
+    if _warm_lock.locked():
+        return
+    threading.Thread(target=warm_up, daemon=True).start()
+
+def _filler_key(text: str) -> str:
+    # Tanda baca penutup tetap bagian dari kunci (lihat strip_phrase_prefix)
+    return text.strip().lower()
+
+def prepare_fillers():
+    """Sintesis semua FILLER_TEXTS yang belum ada di pustaka filler."""
+    os.makedirs(FILLER_DIR, exist_ok=True)
+    for text in FILLER_TEXTS:
+        key = _filler_key(text)
+        if key in _fillers:
+            continue
+        path = _synthesize(text)
+        if path.startswith("[ERROR]"):
+            logger.error("Gagal menyiapkan filler: %s", text)
+            continue
+        filler_path = os.path.join(FILLER_DIR, f"filler_{uuid.uuid4()}.wav")
+        os.replace(path, filler_path)
+        _fillers[key] = filler_path
+
+def _match_filler(text: str):
+    """
+    Cari filler terpanjang yang cocok dengan awal teks.
+    Returns:
+        tuple: (path filler, sisa teks) atau (None, text) jika tidak ada yang cocok
+    """
+    for key in sorted(_fillers, key=len, reverse=True):
+        rest = strip_phrase_prefix(text, key)
+        if rest is not None:
+            return _fillers[key], rest
+    return None, text
+
+_SAMPLE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+def _join_wavs(paths: list, output_path: str, gap_ms: int = TTS_SENTENCE_GAP_MS) -> str:
+    """
+    Gabungkan beberapa file WAV berformat sama secara berurutan dengan jeda hening
+    di antaranya, memakai satu np.concatenate untuk semua buffer PCM.
+    """
+    with wave.open(paths[0], "rb") as first:
+        params = first.getparams()
+    dtype = _SAMPLE_DTYPES[params.sampwidth]
+    # PCM 8-bit bersifat unsigned sehingga titik heningnya 128, bukan 0
+    silence_value = 128 if params.sampwidth == 1 else 0
+    silence = np.full(int(params.framerate * gap_ms / 1000) * params.nchannels, silence_value, dtype=dtype)
+
+    buffers = []
+    for i, path in enumerate(paths):
+        with wave.open(path, "rb") as wf:
+            buffers.append(np.frombuffer(wf.readframes(wf.getnframes()), dtype=dtype))
+        if i < len(paths) - 1 and silence.size:
+            buffers.append(silence)
+
+    with wave.open(output_path, "wb") as out:
+        out.setparams(params)
+        out.writeframes(np.concatenate(buffers).tobytes())
+    return output_path
+
+def _cache_key(text: str) -> str:
+    return " ".join(text.split())
+
+def _shared_key(key: str, fmt: str) -> str:
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return f"tts:{digest}:{fmt}"
+
+def _local_put(key: str, wav_path: str) -> dict:
+    with _cache_lock:
+        entry = {"wav": wav_path}
+        _tts_cache[key] = entry
+        _tts_cache.move_to_end(key)
+        while len(_tts_cache) > TTS_CACHE_SIZE:
+            _, evicted = _tts_cache.popitem(last=False)
+            # Audio filler dimiliki pustaka filler, jangan dihapus
+            if not evicted["wav"].startswith(FILLER_DIR) and os.path.exists(evicted["wav"]):
+                os.remove(evicted["wav"])
+        return entry
+
+def _cache_get(text: str):
+    key = _cache_key(text)
+    with _cache_lock:
+        entry = _tts_cache.get(key)
+        if entry is not None and os.path.exists(entry["wav"]):
+            _tts_cache.move_to_end(key)
+            return entry
+        _tts_cache.pop(key, None)
+
+    # Tidak ada di cache lokal: cek cache bersama, mungkin disintesis worker lain
+    try:
+        wav_bytes = get_backend().get(_shared_key(key, "wav"))
+    except Exception as e:
+        logger.error("Gagal membaca cache TTS bersama: %s", e)
+        return None
+    if wav_bytes is None:
+        return None
+
+    wav_path = os.path.join(tempfile.gettempdir(), f"tts_{uuid.uuid4()}.wav")
+    with open(wav_path, "wb") as f:
+        f.write(wav_bytes)
+    return _local_put(key, wav_path)
+
+def _cache_put(text: str, wav_path: str):
+    key = _cache_key(text)
+    _local_put(key, wav_path)
+    try:
+        with open(wav_path, "rb") as f:
+            get_backend().set(_shared_key(key, "wav"), f.read(), ttl=TTS_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.error("Gagal menulis cache TTS bersama: %s", e)
+
+def get_encoded_audio(text: str, wav, fmt: str) -> bytes:
+    """
+    Kembalikan audio respons dalam format `fmt`, memakai hasil enkode yang
+    tersimpan di cache TTS (lokal lalu bersama) jika ada.
+    Args:
+        text (str): Teks yang disintesis (kunci cache)
+        wav (bytes | str): Isi WAV atau path WAV hasil transcribe_text_to_speech
+        fmt (str): Nama format di audio_codec.AUDIO_FORMATS
+    Returns:
+        bytes: Audio terenkode
+    """
+    key = _cache_key(text)
+    entry = _cache_get(text)
+    if entry is not None and fmt in entry:
+        return entry[fmt]
+
+    backend = get_backend()
+    data = backend.get(_shared_key(key, fmt))
+    if data is None:
+        data = encode_audio(wav, fmt)
+        backend.set(_shared_key(key, fmt), data, ttl=TTS_CACHE_TTL_SECONDS)
+
+    if entry is not None:
+        with _cache_lock:
+            entry[fmt] = data
+    return data
+
+def _synthesize(text: str) -> str:
+    """Normalisasi dan fonemisasi teks sebelum dikirim ke Coqui."""
+    return _tts_with_coqui(text_to_phonemes(text))
+
+def _private_copy(wav_path: str) -> str:
+    """Hard link (atau salinan jika tidak didukung) file audio untuk satu pemanggil."""
+    copy_path = os.path.join(tempfile.gettempdir(), f"tts_{uuid.uuid4()}.wav")
+    try:
+        os.link(wav_path, copy_path)
+    except OSError:
+        shutil.copyfile(wav_path, copy_path)
+    return copy_path
+
 def transcribe_text_to_speech(text: str) -> str:
     """
     Fungsi untuk mengonversi teks menjadi suara menggunakan TTS engine yang ditentukan.
     Args:
         text (str): Teks yang akan diubah menjadi suara.
     Returns:
-        str: Path ke file audio hasil konversi.
+        str: Path ke file audio hasil konversi. File ini milik pemanggil (bukan file
+            cache yang bisa dihapus saat eviksi) dan sebaiknya dihapus setelah dipakai.
     """
-    path = _tts_with_coqui(text)
-    return path
+    global _last_used
+    _last_used = time.monotonic()
+
+    cached = _cache_get(text)
+    if cached is not None:
+        # Salinan dibuat di bawah lock agar file tidak terhapus eviksi di thread lain
+        with _cache_lock:
+            if os.path.exists(cached["wav"]):
+                return _private_copy(cached["wav"])
+
+    path = _synthesize_response(text)
+    if path.startswith("[ERROR]"):
+        return path
+    private_path = _private_copy(path)
+    _cache_put(text, path)
+    return private_path
+
+def _synthesize_response(text: str) -> str:
+    filler_path, rest = _match_filler(text)
+    sentences = split_sentences(rest)
+    if not sentences:
+        return filler_path if filler_path else "[ERROR] Empty text"
+    if filler_path is None and len(sentences) == 1:
+        return _synthesize(sentences[0])
+
+    # Sintesis setiap kalimat secara paralel; urutan futures menjaga urutan hasil.
+    # Context disalin agar ID korelasi log ikut ke thread pool.
+    futures = [
+        _tts_executor.submit(contextvars.copy_context().run, _synthesize, sentence)
+        for sentence in sentences
+    ]
+    sentence_paths = [future.result() for future in futures]
+    try:
+        for path in sentence_paths:
+            if path.startswith("[ERROR]"):
+                return path
+
+        segments = ([filler_path] if filler_path else []) + sentence_paths
+        output_path = os.path.join(tempfile.gettempdir(), f"tts_{uuid.uuid4()}.wav")
+        return _join_wavs(segments, output_path)
+    finally:
+        for path in sentence_paths:
+            if not path.startswith("[ERROR]") and os.path.exists(path):
+                os.remove(path)
 
 # === ENGINE 1: Coqui TTS ===
 def _tts_with_coqui(text: str) -> str:
@@ -41,48 +331,33 @@ def _tts_with_coqui(text: str) -> str:
     abs_config_path = os.path.abspath(COQUI_CONFIG_PATH)
     abs_output_path = os.path.abspath(output_path)
     
-    # Jalankan TTS dari direktori yang berisi speakers.pth
-    current_dir = os.getcwd()
-    
+    # jalankan Coqui TTS dengan subprocess dari direktori yang berisi speakers.pth.
+    # cwd diberikan ke subprocess (bukan os.chdir) agar aman dipanggil dari banyak thread.
+    cmd = [
+        "tts",
+        "--text", text,
+        "--model_path", abs_model_path,
+        "--config_path", abs_config_path,
+        "--speaker_idx", COQUI_SPEAKER,
+        "--out_path", abs_output_path
+    ]
+
+    logger.debug("Menjalankan TTS dari direktori %s: %s", COQUI_DIR, cmd)
+
     try:
-        # Pindah ke direktori coqui_utils
-        os.chdir(COQUI_DIR)
-        
-        # jalankan Coqui TTS dengan subprocess
-        cmd = [
-            "tts",
-            "--text", text,
-            "--model_path", abs_model_path,
-            "--config_path", abs_config_path,
-            "--speaker_idx", COQUI_SPEAKER,
-            "--out_path", abs_output_path
-        ]
-        
-        print(f"Running TTS command from directory: {os.getcwd()}")
-        print(f"Command: {' '.join(cmd)}")
-        
-        try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
-            if result.stdout:
-                print(f"TTS stdout: {result.stdout}")
-            if result.stderr:
-                print(f"TTS stderr: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            print(f"[ERROR] TTS subprocess failed: {e}")
-            if e.stdout:
-                print(f"TTS stdout: {e.stdout}")
-            if e.stderr:
-                print(f"TTS stderr: {e.stderr}")
-            return "[ERROR] Failed to synthesize speech"
-            
-        # Verifikasi file output
-        if os.path.exists(abs_output_path):
-            print(f"TTS output file created successfully: {abs_output_path}")
-            return abs_output_path
-        else:
-            print(f"TTS output file not found at: {abs_output_path}")
-            return "[ERROR] TTS output file not found"
-            
-    finally:
-        # Kembali ke direktori asal
-        os.chdir(current_dir)
\ No newline at end of file
+        # Thread intra-op torch di proses Coqui dibatasi lewat OMP_NUM_THREADS sesuai
+        # jatah scheduler CPU (lihat app/cpu.py)
+        with cpu.scheduler.job("tts") as budget:
+            result = cpu.run(cmd, budget, cwd=COQUI_DIR)
+        logger.debug("TTS selesai", extra={"stdout": result.stdout, "stderr": result.stderr, "threads": budget.threads})
+    except subprocess.CalledProcessError as e:
+        logger.error("TTS subprocess failed: %s", e, extra={"stdout": e.stdout, "stderr": e.stderr})
+        return "[ERROR] Failed to synthesize speech"
+
+    # Verifikasi file output
+    if os.path.exists(abs_output_path):
+        logger.debug("TTS output file created successfully: %s", abs_output_path)
+        return abs_output_path
+    else:
+        logger.error("TTS output file not found at: %s", abs_output_path)
+        return "[ERROR] TTS output file not found"
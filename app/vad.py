@@ -0,0 +1,168 @@
+import os
+import io
+import wave
+import numpy as np
+
+# Panjang satu frame analisis energi
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))
+
+# Ambang RMS (skala -1..1) untuk menganggap satu frame sebagai ucapan
+VAD_ENERGY_THRESHOLD = float(os.getenv("VAD_ENERGY_THRESHOLD", "0.01"))
+
+# Lama keheningan setelah ucapan sebelum dianggap selesai bicara (endpoint)
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "700"))
+
+# Minimal total ucapan agar endpoint dipicu (menghindari klik/derau singkat)
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "200"))
+
+# Pre-check rekaman utuh: rekaman dengan proporsi frame ucapan di bawah ambang ini,
+# atau yang lebih pendek dari SILENCE_MIN_DURATION_SECONDS, dianggap tidak berisi suara
+SILENCE_MIN_SPEECH_RATIO = float(os.getenv("SILENCE_MIN_SPEECH_RATIO", "0.05"))
+SILENCE_MIN_DURATION_SECONDS = float(os.getenv("SILENCE_MIN_DURATION_SECONDS", "0.3"))
+
+def pcm16_to_float(pcm: bytes) -> np.ndarray:
+    """Konversi PCM 16-bit little-endian ke float32 dalam rentang -1..1."""
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+def frame_rms(samples: np.ndarray, sample_rate: int, frame_ms: int = VAD_FRAME_MS) -> np.ndarray:
+    """
+    Hitung energi RMS per frame secara vektoris. Sisa sampel yang tidak
+    memenuhi satu frame penuh diabaikan.
+    """
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+def speech_ratio(rms: np.ndarray, threshold: float = VAD_ENERGY_THRESHOLD) -> float:
+    """Proporsi frame yang energinya di atas ambang ucapan."""
+    if rms.size == 0:
+        return 0.0
+    return float(np.count_nonzero(rms > threshold)) / rms.size
+
+def read_wav_pcm16(source):
+    """
+    Baca WAV PCM 16-bit sebagai array mono.
+    Args:
+        source (bytes | str): Isi file WAV atau path ke file WAV
+    Returns:
+        tuple | None: (sampel int16 mono, sample rate), atau None jika bukan WAV 16-bit
+    """
+    try:
+        with wave.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source, "rb") as wf:
+            if wf.getsampwidth() != 2:
+                return None
+            sample_rate = wf.getframerate()
+            channels = wf.getnchannels()
+            pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2")
+    except (wave.Error, EOFError, OSError):
+        return None
+
+    # Gabungkan kanal menjadi mono
+    if channels > 1:
+        pcm = pcm[:len(pcm) - len(pcm) % channels].reshape(-1, channels).mean(axis=1).astype("<i2")
+    return pcm, sample_rate
+
+def detect_silence(source):
+    """
+    Pre-check murah sebelum pipeline STT -> LLM -> TTS: hitung energi RMS dan
+    proporsi frame ucapan dari seluruh rekaman.
+    Args:
+        source (bytes | str): Isi file WAV atau path ke file WAV
+    Returns:
+        dict | None: {"silent", "rms", "speech_ratio", "duration"}, atau None jika
+            format tidak bisa dianalisis (rekaman diteruskan ke pipeline seperti biasa)
+    """
+    wav = read_wav_pcm16(source)
+    if wav is None:
+        return None
+    pcm, sample_rate = wav
+    samples = pcm.astype(np.float32) / 32768.0
+    duration = len(samples) / float(sample_rate) if sample_rate else 0.0
+
+    rms = float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+    ratio = speech_ratio(frame_rms(samples, sample_rate))
+    silent = duration < SILENCE_MIN_DURATION_SECONDS or ratio < SILENCE_MIN_SPEECH_RATIO
+    return {"silent": silent, "rms": rms, "speech_ratio": ratio, "duration": duration}
+
+class EnergyVAD:
+    """
+    Deteksi akhir ucapan (endpointing) berbasis energi untuk audio streaming.
+    Audio PCM 16-bit mono dimasukkan bertahap lewat process(); endpoint terjadi
+    setelah ada ucapan yang cukup panjang diikuti keheningan selama silence_ms.
+    """
+
+    def __init__(self, sample_rate: int = 16000, threshold: float = VAD_ENERGY_THRESHOLD,
+                 silence_ms: int = VAD_SILENCE_MS, min_speech_ms: int = VAD_MIN_SPEECH_MS,
+                 frame_ms: int = VAD_FRAME_MS):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.frame_ms = frame_ms
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * 2
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.reset()
+
+    def reset(self):
+        self._pending = b""
+        self.speech_frames = 0
+        self.trailing_silence = 0
+
+    @property
+    def speech_started(self) -> bool:
+        return self.speech_frames > 0
+
+    def process(self, pcm: bytes) -> bool:
+        """
+        Proses potongan audio baru.
+        Returns:
+            bool: True jika akhir ucapan terdeteksi
+        """
+        data = self._pending + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        if usable == 0:
+            return False
+
+        is_speech = frame_rms(pcm16_to_float(data[:usable]), self.sample_rate, self.frame_ms) > self.threshold
+        speech_idx = np.flatnonzero(is_speech)
+        if speech_idx.size:
+            self.speech_frames += speech_idx.size
+            self.trailing_silence = len(is_speech) - 1 - int(speech_idx[-1])
+        elif self.speech_started:
+            self.trailing_silence += len(is_speech)
+
+        return (self.speech_frames >= self.min_speech_frames
+                and self.trailing_silence >= self.silence_frames)
+
+def find_silence_splits(samples: np.ndarray, sample_rate: int, target_seconds: float,
+                        search_seconds: float, frame_ms: int = VAD_FRAME_MS) -> list:
+    """
+    Tentukan titik potong audio panjang di bagian paling hening dekat setiap
+    kelipatan `target_seconds`, sehingga kata tidak terpotong di tengah.
+    Args:
+        samples (np.ndarray): Sampel mono float dalam rentang -1..1
+        sample_rate (int): Sample rate audio
+        target_seconds (float): Panjang segmen yang diinginkan
+        search_seconds (float): Jarak maksimum pergeseran titik potong dari target
+    Returns:
+        list: Indeks sampel batas segmen, diawali 0 dan diakhiri len(samples)
+    """
+    rms = frame_rms(samples, sample_rate, frame_ms)
+    frame_len = max(1, int(sample_rate * frame_ms / 1000))
+    target = max(1, int(target_seconds * 1000 / frame_ms))
+    search = max(1, int(search_seconds * 1000 / frame_ms))
+
+    cuts = [0]
+    pos = 0
+    # Sisa yang kurang dari 1.5x target digabung ke segmen terakhir
+    while len(rms) - pos > target * 1.5:
+        lo = pos + max(1, target - search)
+        hi = min(len(rms), pos + target + search)
+        cut = lo + int(np.argmin(rms[lo:hi]))
+        cuts.append(cut * frame_len)
+        pos = cut
+    cuts.append(len(samples))
+    return cuts
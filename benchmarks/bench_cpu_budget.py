@@ -0,0 +1,75 @@
+"""
+Benchmark jumlah thread whisper-cli per job untuk beberapa tingkat konkurensi.
+
+Untuk setiap kombinasi (jumlah job bersamaan, thread per job), sejumlah job
+whisper dijalankan serentak pada file WAV yang sama. Hasilnya latensi rata-rata
+per job dan throughput (detik audio per detik). Kombinasi dengan throughput
+tertinggi per tingkat konkurensi adalah setelan terbaik; bandingkan dengan
+"auto" (jatah dari app.cpu.scheduler). Jalankan dari root repository:
+
+    python benchmarks/bench_cpu_budget.py --audio contoh.wav --concurrency 1,2,4 --threads 1,2,4,8
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import cpu
+from app.stt import WHISPER_BINARY, WHISPER_MODEL_PATH
+from app.audio_codec import wav_duration_seconds
+
+def run_whisper(audio_path: str, model_path: str, threads, tmpdir: str, index: int) -> float:
+    start = time.perf_counter()
+    with cpu.scheduler.job("stt") as budget:
+        if threads != "auto":
+            budget = cpu.Budget(int(threads), budget.cores)
+        cmd = [
+            WHISPER_BINARY,
+            "-m", model_path,
+            "-f", audio_path,
+            "-t", str(budget.threads),
+            "-oj",
+            "-of", os.path.join(tmpdir, f"bench_{index}"),
+        ]
+        cpu.run(cmd, budget)
+    return time.perf_counter() - start
+
+def run_setting(audio_path: str, model_path: str, concurrency: int, threads, rounds: int):
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmpdir, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_whisper, audio_path, model_path, threads, tmpdir, i)
+            for i in range(concurrency * rounds)
+        ]
+        latencies = [future.result() for future in futures]
+    return sum(latencies) / len(latencies), len(latencies) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thread whisper-cli per job")
+    parser.add_argument("--audio", required=True, help="File WAV yang ditranskrip")
+    parser.add_argument("--model", default=WHISPER_MODEL_PATH)
+    parser.add_argument("--concurrency", default="1,2,4")
+    parser.add_argument("--threads", default="1,2,4,8,auto")
+    parser.add_argument("--rounds", type=int, default=2, help="Job per slot konkurensi")
+    args = parser.parse_args()
+
+    duration = wav_duration_seconds(args.audio) or 0.0
+    print(f"Core tersedia: {cpu.CPU_CORES}, durasi audio: {duration:.1f} s, affinity: {cpu.CPU_AFFINITY}")
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        best = None
+        for threads in args.threads.split(","):
+            latency, jobs_per_second = run_setting(args.audio, args.model, concurrency, threads, args.rounds)
+            throughput = jobs_per_second * duration
+            print(f"konkurensi={concurrency:<3} thread={threads:<5} "
+                  f"latensi={latency:6.2f} s  throughput={throughput:6.2f} detik audio/s")
+            if best is None or jobs_per_second > best[1]:
+                best = (threads, jobs_per_second)
+        print(f"-> terbaik untuk konkurensi {concurrency}: thread={best[0]}\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark waktu import app.main.
+
+Setiap percobaan dijalankan di proses Python baru agar cache modul tidak
+mempengaruhi hasil. Jalankan dari root repository:
+
+    python benchmarks/bench_import.py --runs 10
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark waktu import modul API")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    timings = [measure_import(args.module) for _ in range(args.runs)]
+    total = time.perf_counter() - start
+
+    print(f"Modul      : {args.module}")
+    print(f"Percobaan  : {args.runs}")
+    print(f"Median     : {statistics.median(timings) * 1000:.1f} ms")
+    print(f"Min / Max  : {min(timings) * 1000:.1f} / {max(timings) * 1000:.1f} ms")
+    print(f"Total wall : {total:.2f} s")
+
+if __name__ == "__main__":
+    main()
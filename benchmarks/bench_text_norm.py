@@ -0,0 +1,49 @@
+"""
+Benchmark biaya normalisasi + fonemisasi per kalimat sebelum Coqui TTS.
+
+Mengukur putaran pertama (leksikon fonem kosong) dan putaran berikutnya
+(kata sudah ada di cache LRU). Jalankan dari root repository:
+
+    python benchmarks/bench_text_norm.py --rounds 5
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.text_norm import normalize_text, text_to_phonemes, cache_info
+
+SAMPLE_SENTENCES = [
+    "Hari ini cuacanya cerah di sebagian besar wilayah, dengan suhu sekitar 30 derajat.",
+    "Presiden Indonesia saat ini adalah Prabowo Subianto.",
+    "Proklamasi kemerdekaan dibacakan pada 17/08/1945 pukul 10.00 WIB.",
+    "Harga beras naik 3,5% menjadi Rp 15.000 per kg.",
+    "Jarak Jakarta ke Bandung sekitar 150 km, tergantung rute yg dipilih.",
+    "Maaf, saya tidak tahu jawabannya.",
+]
+
+def run_round(fn, sentences) -> float:
+    start = time.perf_counter()
+    for sentence in sentences:
+        fn(sentence)
+    return (time.perf_counter() - start) / len(sentences)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark normalisasi teks TTS")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    norm_cost = run_round(normalize_text, SAMPLE_SENTENCES)
+    print(f"normalize_text           : {norm_cost * 1e6:.1f} us/kalimat")
+
+    for i in range(args.rounds):
+        cost = run_round(text_to_phonemes, SAMPLE_SENTENCES)
+        label = "dingin" if i == 0 else "hangat"
+        print(f"text_to_phonemes [{label}] : {cost * 1e6:.1f} us/kalimat")
+
+    print(f"Leksikon fonem           : {cache_info()}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import os
+import io
+import uuid
+import asyncio
 import tempfile
-import requests
+import httpx
 import gradio as gr
 import scipy.io.wavfile
 import time
@@ -10,6 +13,52 @@ import base64
 # Konfigurasi API endpoint
 API_URL = "http://localhost:8000/voice-chat"
 
+# Format audio yang diminta dari API. MP3 jauh lebih kecil dari WAV dan
+# didukung oleh pemutar audio di semua browser.
+RESPONSE_AUDIO_FORMAT = os.getenv("RESPONSE_AUDIO_FORMAT", "mp3")
+AUDIO_EXTENSIONS = {"wav": ".wav", "pcm16k": ".wav", "opus": ".ogg", "mp3": ".mp3"}
+
+# Jumlah permintaan yang boleh diproses bersamaan. Samakan dengan kapasitas backend
+# (jumlah worker API x pipeline paralel per worker); sisanya menunggu di antrean Gradio.
+BACKEND_CONCURRENCY = int(os.getenv("BACKEND_CONCURRENCY", "4"))
+QUEUE_MAX_SIZE = int(os.getenv("QUEUE_MAX_SIZE", "64"))
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", "500"))
+
+# Rekaman yang hampir seluruhnya hening tidak dikirim ke API. Nilainya mengikuti
+# pre-check di backend (app/vad.py): ambang RMS per frame 30 ms dan proporsi frame ucapan.
+SILENCE_ENERGY_THRESHOLD = float(os.getenv("VAD_ENERGY_THRESHOLD", "0.01"))
+SILENCE_MIN_SPEECH_RATIO = float(os.getenv("SILENCE_MIN_SPEECH_RATIO", "0.05"))
+
+# Klien HTTP async dipakai bersama agar koneksi ke API bisa digunakan ulang
+_http_client = None
+
+def get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=API_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=BACKEND_CONCURRENCY),
+        )
+    return _http_client
+
+def is_silent(sr, audio_data):
+    """Cek cepat apakah rekaman dari mikrofon praktis tidak berisi suara."""
+    samples = np.asarray(audio_data)
+    if samples.size == 0:
+        return True
+    if np.issubdtype(samples.dtype, np.integer):
+        samples = samples.astype(np.float32) / np.iinfo(samples.dtype).max
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+
+    frame_len = max(1, int(sr * 0.03))
+    n_frames = len(samples) // frame_len
+    if n_frames == 0:
+        return True
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return np.count_nonzero(rms > SILENCE_ENERGY_THRESHOLD) / n_frames < SILENCE_MIN_SPEECH_RATIO
+
 def decode_base64(b64_text):
     """Decode teks base64 ke UTF-8"""
     if not b64_text:
@@ -111,7 +160,7 @@ def translate_to_indonesian(english_text):
     
     return translated_text
 
-def voice_chat(audio):
+async def voice_chat(audio):
     """
     Fungsi utama untuk mengirimkan audio ke API dan mendapatkan respons
     """
@@ -120,20 +169,23 @@ def voice_chat(audio):
     
     # Dapatkan data audio
     sr, audio_data = audio
-    audio_path = None
+
+    # Rekaman hening tidak perlu dikirim ke API
+    if is_silent(sr, audio_data):
+        return None, "Suara tidak terdengar. Silakan rekam ulang dengan suara lebih jelas.", ""
     
     try:
-        # Simpan audio ke file sementara
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmpfile:
-            scipy.io.wavfile.write(tmpfile.name, sr, audio_data)
-            audio_path = tmpfile.name
-        
-        print(f"Audio disimpan di: {audio_path}")
+        # Enkode audio ke WAV di memori (tanpa file sementara)
+        buf = io.BytesIO()
+        scipy.io.wavfile.write(buf, sr, audio_data)
         
-        # Kirim ke API
-        with open(audio_path, "rb") as f:
-            files = {"file": ("voice.wav", f, "audio/wav")}
-            response = requests.post(API_URL, files=files, timeout=500)
+        # Kirim ke API tanpa memblokir thread worker Gradio
+        files = {"file": ("voice.wav", buf.getvalue(), "audio/wav")}
+        response = await get_http_client().post(
+            API_URL,
+            files=files,
+            params={"format": RESPONSE_AUDIO_FORMAT},
+        )
         
         print(f"Status respons API: {response.status_code}")
         
@@ -141,7 +193,10 @@ def voice_chat(audio):
             # Simpan respons audio
             output_dir = os.path.join(tempfile.gettempdir(), "voice_chat_output")
             os.makedirs(output_dir, exist_ok=True)
-            output_path = os.path.join(output_dir, f"response_{int(time.time())}.wav")
+            audio_format = response.headers.get("X-Audio-Format", "wav")
+            ext = AUDIO_EXTENSIONS.get(audio_format, ".wav")
+            # uuid mencegah tabrakan nama file antar tab yang memproses di detik yang sama
+            output_path = os.path.join(output_dir, f"response_{int(time.time())}_{uuid.uuid4().hex[:8]}{ext}")
             
             with open(output_path, "wb") as f:
                 f.write(response.content)
@@ -172,13 +227,6 @@ def voice_chat(audio):
     except Exception as e:
         print(f"Terjadi kesalahan: {e}")
         return None, f"Error: {str(e)}", ""
-    finally:
-        # Hapus file sementara
-        if audio_path and os.path.exists(audio_path):
-            try:
-                os.unlink(audio_path)
-            except:
-                pass
 
 # Custom CSS untuk tampilan abu-abu dan kuning elegan dengan font Poppins
 custom_css = """
@@ -522,11 +570,22 @@ with gr.Blocks(title="Voice Chatbot AI", css=custom_css) as demo:
             gr.Markdown("© 2025 Voice Chatbot AI | Powered by Whisper, Gemini, & TTS")
     
     # Event handlers yang diperbarui
-    def process_voice(audio):
+    async def process_voice(audio):
         if audio is None:
-            return None, "*Silakan rekam audio terlebih dahulu*", "*Respons asisten akan muncul di sini...*", "Silakan rekam audio terlebih dahulu"
+            yield None, "*Silakan rekam audio terlebih dahulu*", "*Respons asisten akan muncul di sini...*", "Silakan rekam audio terlebih dahulu"
+            return
         
-        output_path, transcription, response_text = voice_chat(audio)
+        # Jalankan permintaan sebagai task dan kirim status berkala ke status_box selama menunggu
+        task = asyncio.create_task(voice_chat(audio))
+        start = time.monotonic()
+        yield gr.update(), gr.update(), gr.update(), "Mengirim audio ke server..."
+        while not task.done():
+            await asyncio.wait({task}, timeout=1.0)
+            if not task.done():
+                elapsed = time.monotonic() - start
+                yield gr.update(), gr.update(), gr.update(), f"Memproses suara... ({elapsed:.0f} detik)"
+        
+        output_path, transcription, response_text = task.result()
         
         # Tampilkan transcription dan response sebagai Markdown
         if transcription:
@@ -540,13 +599,20 @@ with gr.Blocks(title="Voice Chatbot AI", css=custom_css) as demo:
             response_md = response_text
         else:
             response_md = "*Tidak ada respons yang tersedia*"
-            
-        return output_path, transcript_md, response_md, "Audio diproses dengan sukses"
+        
+        elapsed = time.monotonic() - start
+        if output_path:
+            status = f"Audio diproses dengan sukses ({elapsed:.1f} detik)"
+        else:
+            status = "Gagal memproses audio"
+        yield output_path, transcript_md, response_md, status
     
     submit_btn.click(
         fn=process_voice,
         inputs=[audio_input],
-        outputs=[audio_output, transcript_display, response_display, status_box]
+        outputs=[audio_output, transcript_display, response_display, status_box],
+        concurrency_limit=BACKEND_CONCURRENCY,
+        concurrency_id="backend",
     )
     
     # Clear handler
@@ -576,6 +642,9 @@ if __name__ == "__main__":
     output_dir = os.path.join(tempfile.gettempdir(), "voice_chat_output")
     os.makedirs(output_dir, exist_ok=True)
 
+    # Antrean eksplisit: permintaan di atas BACKEND_CONCURRENCY menunggu di antrean
+    # (bukan memakan thread), dan antrean dibatasi QUEUE_MAX_SIZE.
+    demo.queue(max_size=QUEUE_MAX_SIZE, default_concurrency_limit=BACKEND_CONCURRENCY)
     demo.launch(
         server_name="127.0.0.1", 
         server_port=7860
@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from app import state
+from app.state import MemoryBackend, SQLiteBackend, RedisBackend
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "state.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # release() memakai skrip Lua
+    return RedisBackend(client=fakeredis.FakeRedis())
+
+def test_get_set_roundtrip_as_bytes(backend):
+    assert backend.get("missing") is None
+    backend.set("teks", "halo")
+    backend.set("audio", b"\x00\x01")
+    assert backend.get("teks") == b"halo"
+    assert backend.get("audio") == b"\x00\x01"
+    backend.delete("teks")
+    assert backend.get("teks") is None
+
+def test_entry_expires_after_ttl(backend):
+    backend.set("sementara", "x", ttl=0.05)
+    backend.set("tetap", "y")
+    assert backend.get("sementara") == b"x"
+    time.sleep(0.1)
+    assert backend.get("sementara") is None
+    assert backend.get("tetap") == b"y"
+
+def test_set_sweeps_expired_entries(monkeypatch, tmp_path):
+    monkeypatch.setattr(state, "STATE_SWEEP_INTERVAL_SECONDS", 0)
+    memory = MemoryBackend()
+    sqlite = SQLiteBackend(str(tmp_path / "state.db"))
+    for backend in (memory, sqlite):
+        backend.set("lama", "x", ttl=0.01)
+    time.sleep(0.05)
+    for backend in (memory, sqlite):
+        backend.set("baru", "y")
+
+    # Entri kedaluwarsa terhapus dari penyimpanan tanpa pernah dibaca lagi
+    assert "lama" not in memory._data
+    assert sqlite._connect().execute("SELECT COUNT(*) FROM kv WHERE key = 'lama'").fetchone()[0] == 0
+    assert memory.get("baru") == b"y"
+    assert sqlite.get("baru") == b"y"
+
+def test_lock_excludes_until_released_by_owner(backend):
+    token = backend.acquire("kunci", ttl=5, timeout=1)
+    with pytest.raises(TimeoutError):
+        backend.acquire("kunci", ttl=5, timeout=0.1)
+
+    # Token lain tidak boleh melepas lock milik pemegangnya
+    backend.release("kunci", "bukan-pemilik")
+    with pytest.raises(TimeoutError):
+        backend.acquire("kunci", ttl=5, timeout=0.1)
+
+    backend.release("kunci", token)
+    backend.release("kunci", backend.acquire("kunci", ttl=5, timeout=0.1))
+
+def test_lock_expires_after_ttl(backend):
+    backend.acquire("kunci", ttl=0.05, timeout=1)
+    assert backend.acquire("kunci", ttl=5, timeout=1)
@@ -0,0 +1,25 @@
+from app.text_norm import normalize_text, split_sentences
+
+def test_split_keeps_currency_abbreviation_in_sentence():
+    text = "Harganya Rp. 15.000 per kilo."
+    assert split_sentences(text) == [text]
+    assert normalize_text(split_sentences(text)[0]) == "Harganya lima belas ribu rupiah per kilo."
+
+def test_split_ignores_title_and_address_abbreviations():
+    text = "Praktik dr. Budi ada di Jl. Merdeka No. 5. Prof. Ani juga di sana!"
+    assert split_sentences(text) == [
+        "Praktik dr. Budi ada di Jl. Merdeka No. 5.",
+        "Prof. Ani juga di sana!",
+    ]
+
+def test_split_on_sentence_ending_abbreviation():
+    assert split_sentences("Jaraknya 150 km. Tergantung rute, dll. Baik?") == [
+        "Jaraknya 150 km.",
+        "Tergantung rute, dll.",
+        "Baik?",
+    ]
+
+def test_split_matches_whole_text_normalization():
+    text = "Sewa di Jl. Sudirman Rp. 2.500.000 per bulan. Buka pukul 08.00 WIB."
+    per_sentence = " ".join(normalize_text(s) for s in split_sentences(text))
+    assert per_sentence == normalize_text(text)
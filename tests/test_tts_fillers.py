@@ -0,0 +1,13 @@
+from app.text_norm import strip_phrase_prefix
+
+def test_comma_filler_requires_comma():
+    assert strip_phrase_prefix("Baik, cuacanya cerah hari ini.", "baik,") == "cuacanya cerah hari ini."
+    assert strip_phrase_prefix("Baik sekali cuacanya hari ini.", "baik,") is None
+
+def test_sentence_filler_requires_sentence_end():
+    assert strip_phrase_prefix("Maaf, saya tidak tahu.", "maaf, saya tidak tahu.") == ""
+    assert strip_phrase_prefix("Maaf, saya tidak tahu. Coba tanya lagi.", "maaf, saya tidak tahu.") == "Coba tanya lagi."
+    assert strip_phrase_prefix("Maaf, saya tidak tahu jawabannya.", "maaf, saya tidak tahu.") is None
+
+def test_sentence_filler_not_matched_inside_ellipsis():
+    assert strip_phrase_prefix("Tunggu sebentar... sedang dicari.", "tunggu sebentar.") is None